@@ -12,6 +12,7 @@ from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
 from lck.django.common.admin import ModelAdmin
 
+from ralph_assets.categories import get_category_tree
 from ralph_assets.models import (
     Asset,
     AssetCategory,
@@ -93,14 +94,21 @@ class AssetCategoryAdminForm(forms.ModelForm):
 class AssetCategoryAdmin(ModelAdmin):
     def name(self):
         type = AssetCategoryType.desc_from_id(self.type)
-        if self.parent:
+        if self.parent_id:
             name = '|-- ({}) {}'.format(type, self.name)
         else:
             name = '({}) {}'.format(type, self.name)
         return name
+
+    def parent(self):
+        # from the cached tree instead of a query per row
+        parent = get_category_tree().get(self.parent_id)
+        return parent.name if parent else None
+    parent.admin_order_field = 'parent'
+
     form = AssetCategoryAdminForm
     save_on_top = True
-    list_display = (name, 'parent')
+    list_display = (name, parent)
     search_fields = ('name',)
 
 
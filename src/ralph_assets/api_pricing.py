@@ -5,41 +5,70 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from ralph_assets.models_assets import Asset
+from itertools import groupby
 
+from ralph_assets.deprecation import is_deprecated_by_end_date
+from ralph_assets.models_assets import Asset, AssetType
+from ralph_assets.models_util import CHUNK_SIZE, iterate_queryset
 
-def get_assets(date):
-    """Yields dicts describing all assets"""
-    for asset in Asset.objects_dc.filter(
+
+def get_assets(date, chunk_size=CHUNK_SIZE):
+    """Yields dicts describing all assets.
+
+    Assets are fetched together with their ``DeviceInfo`` in chunks of
+    ``chunk_size`` rows, so the number of queries doesn't depend on the number
+    of assets linked to devices and memory usage stays bounded. Deprecation is
+    read from the stored ``deprecation_end_date``.
+    """
+    queryset = Asset.objects_dc.select_related('device_info').filter(
         part_info_id=None,
         invoice_date__lte=date,
-    ):
+    )
+    for asset in iterate_queryset(queryset, chunk_size):
         device_info = asset.device_info
         yield {
             'asset_id': asset.id,
             'barcode': asset.barcode,
-            'is_deprecated': asset.is_deprecated(date=date),
+            'is_deprecated': is_deprecated_by_end_date(
+                asset.deprecation_end_date,
+                asset.force_deprecation,
+                date,
+            ),
             'price': asset.price,
             'ralph_id': device_info.ralph_device_id if device_info else None,
             'slots': asset.slots,
             'sn': asset.sn,
-            'price': asset.price,
             'deprecation_rate': asset.deprecation_rate,
         }
 
 
 def get_asset_parts():
-    for asset in Asset.objects_dc.all():
-        for part in asset.get_parts():
-            device_info = asset.device_info
+    """Yields dicts describing all parts of DC assets.
+
+    Parts are fetched in a single query, joined with their models and parent
+    devices and grouped by the parent device.
+    """
+    parts = Asset.objects.select_related(
+        'model', 'part_info__device__device_info',
+    ).filter(
+        part_info__device__type__in=AssetType.DC.choices,
+        part_info__device__deleted=False,
+    ).order_by('part_info__device', 'id')
+    for asset, asset_parts in groupby(
+        parts.iterator(), key=lambda part: part.part_info.device,
+    ):
+        device_info = asset.device_info
+        for part in asset_parts:
             yield {
                 'asset_id': part.id,
                 'barcode': asset.barcode,
-                'is_deprecated': part.is_deprecated(),
+                'is_deprecated': is_deprecated_by_end_date(
+                    part.deprecation_end_date,
+                    part.force_deprecation,
+                ),
                 'model': part.model.name if part.model else None,
                 'price': part.price,
                 'ralph_id': device_info.ralph_device_id if device_info else None,  # noqa
                 'sn': asset.sn,
                 'deprecation_rate': asset.deprecation_rate,
-                'is_deprecated': part.is_deprecated(),
             }
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""In-memory autocomplete indexes of asset models, manufacturers, warehouses
+and assets.
+
+Every index keeps the case-folded keys of its objects in a sorted list, so a
+prefix lookup is a bisection followed by a short scan, without a database
+round-trip. Indexes are loaded on first use in every process. Saving an object
+bumps the generation of its index and processes reload the objects modified
+since their last load on their next lookup. Deleting objects makes them reload
+the whole index.
+
+Generations are kept in ``ASSETS_AUTOCOMPLETE_CACHE``, which has to be shared
+by all processes (e.g. memcached), otherwise other processes would never see
+them bumped and lookups query the database instead. Assets are only kept
+while there are at most ``ASSETS_AUTOCOMPLETE_MAX_ASSETS`` of them, larger
+inventories have device lookups query the database.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import bisect
+import datetime
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db.models.signals import post_delete, post_save
+from django.utils.timezone import now
+
+from ralph_assets.cache_util import bump_generation, get_generation, is_shared
+from ralph_assets.models_assets import (
+    Asset,
+    AssetManufacturer,
+    AssetModel,
+    Warehouse,
+)
+
+
+# allowed difference between clocks of processes saving objects
+CLOCK_SKEW = datetime.timedelta(seconds=60)
+WORD_START = re.compile(r'(?<=\s)\S', re.UNICODE)
+
+
+def autocomplete_enabled():
+    """Whether ajax lookups are served from the in-memory indexes: unless
+    disabled with ``ASSETS_AUTOCOMPLETE_INDEX``, when their generations are
+    kept in a shared cache."""
+    return getattr(settings, 'ASSETS_AUTOCOMPLETE_INDEX', True) and is_shared(
+        get_autocomplete_cache(),
+    )
+
+
+def get_autocomplete_cache():
+    """The cache holding generations of the indexes: an alias from ``CACHES``
+    or a backend path given in ``ASSETS_AUTOCOMPLETE_CACHE``."""
+    return get_cache(
+        getattr(settings, 'ASSETS_AUTOCOMPLETE_CACHE', 'default'),
+    )
+
+
+def get_max_assets():
+    """Number of assets above which they aren't indexed."""
+    return getattr(settings, 'ASSETS_AUTOCOMPLETE_MAX_ASSETS', 50000)
+
+
+def fold(value):
+    return (value or '').lower()
+
+
+def get_word_keys(value):
+    """Return the case-folded ``value`` and its suffixes starting with every
+    following word, so that a prefix of any word matches."""
+    value = fold(value)
+    return [value] + [
+        value[match.start():] for match in WORD_START.finditer(value)
+    ]
+
+
+class Record(object):
+    """Indexed values of an object. Like model instances, records have a
+    ``pk``, which ajax lookups send as the picked object."""
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class PrefixIndex(object):
+    """Sorted ``(key, id)`` pairs of items."""
+
+    def __init__(self):
+        self.entries = []
+        self.keys = {}
+
+    def load(self, items):
+        """Replace the contents with ``(id, keys)`` pairs."""
+        self.keys = dict(
+            (item_id, sorted(set(key for key in keys if key)))
+            for item_id, keys in items
+        )
+        self.entries = sorted(
+            (key, item_id)
+            for item_id, keys in self.keys.iteritems() for key in keys
+        )
+
+    def set(self, item_id, keys):
+        self.remove(item_id)
+        keys = sorted(set(key for key in keys if key))
+        for key in keys:
+            bisect.insort(self.entries, (key, item_id))
+        self.keys[item_id] = keys
+
+    def remove(self, item_id):
+        for key in self.keys.pop(item_id, ()):
+            del self.entries[bisect.bisect_left(self.entries, (key, item_id))]
+
+    def find(self, prefix):
+        """Yield ids of items having a key starting with ``prefix`` in the
+        order of their keys, each once."""
+        prefix = fold(prefix)
+        seen = set()
+        for i in xrange(
+            bisect.bisect_left(self.entries, (prefix,)), len(self.entries),
+        ):
+            key, item_id = self.entries[i]
+            if not key.startswith(prefix):
+                return
+            if item_id not in seen:
+                seen.add(item_id)
+                yield item_id
+
+
+class AutocompleteIndex(object):
+    """Records of objects of ``model`` with the values of ``fields`` (paths
+    as in ``values_list``), indexed by :meth:`get_keys`."""
+
+    model = None
+    fields = ()
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.records = {}
+        self.prefixes = PrefixIndex()
+        self.generation = None
+        self.reset = None
+        self.loaded_at = None
+        name = 'ralph_assets.autocomplete.{}'.format(
+            self.model._meta.object_name.lower(),
+        )
+        self.generation_key = name + '.generation'
+        self.reset_key = name + '.reset'
+
+    def get_queryset(self):
+        return self.model._default_manager.all()
+
+    def get_changed_queryset(self, since):
+        """Objects modified since ``since``, including the ones which stopped
+        being indexed."""
+        return self.get_queryset().filter(modified__gte=since)
+
+    def get_keys(self, record):
+        raise NotImplementedError
+
+    def is_indexed(self, record):
+        return True
+
+    def search(self, prefix, limit=None, predicate=None):
+        """Return at most ``limit`` records with keys starting with
+        ``prefix`` (and accepted by ``predicate``) in the order of keys."""
+        with self.lock:
+            self.refresh()
+            results = []
+            if limit == 0:
+                return results
+            for item_id in self.prefixes.find(prefix):
+                record = self.records[item_id]
+                if predicate is None or predicate(record):
+                    results.append(record)
+                    if len(results) == limit:
+                        break
+            return results
+
+    def get_records(self):
+        """Return the records of all indexed objects."""
+        with self.lock:
+            self.refresh()
+            return self.records.values()
+
+    def refresh(self):
+        """Bring the index up to date with the generations of the cache."""
+        with self.lock:
+            cache = get_autocomplete_cache()
+            reset = get_generation(cache, self.reset_key)
+            generation = get_generation(cache, self.generation_key)
+            if reset != self.reset:
+                self._load()
+            elif generation != self.generation:
+                self._update()
+            self.reset = reset
+            self.generation = generation
+
+    def _load(self):
+        self.loaded_at = now()
+        self.records = {}
+        for record in self._get_records(self.get_queryset()):
+            if self.is_indexed(record):
+                self._add(record)
+        self.prefixes.load(
+            (record.id, self.get_keys(record))
+            for record in self.records.itervalues()
+        )
+
+    def _update(self):
+        since = self.loaded_at - CLOCK_SKEW
+        self.loaded_at = now()
+        queryset = self.get_changed_queryset(since)
+        for record in self._get_records(queryset):
+            self._remove(record.id)
+            if self.is_indexed(record):
+                self._add(record)
+                self.prefixes.set(record.id, self.get_keys(record))
+
+    def _get_records(self, queryset):
+        for values in queryset.values_list(*self.fields).iterator():
+            yield Record(**dict(zip(self.fields, values)))
+
+    def _add(self, record):
+        self.records[record.id] = record
+
+    def _remove(self, item_id):
+        self.records.pop(item_id, None)
+        self.prefixes.remove(item_id)
+
+    def connect(self):
+        """Invalidate the index on changes of its objects."""
+        post_save.connect(
+            self._changed, sender=self.model,
+            dispatch_uid=self.generation_key,
+        )
+        post_delete.connect(
+            self._deleted, sender=self.model, dispatch_uid=self.reset_key,
+        )
+
+    def _changed(self, sender, **kwargs):
+        bump_generation(get_autocomplete_cache(), self.generation_key)
+
+    def _deleted(self, sender, **kwargs):
+        bump_generation(get_autocomplete_cache(), self.reset_key)
+
+
+class NameIndex(AutocompleteIndex):
+    """Objects matched by a prefix of any word of their names."""
+
+    fields = ('id', 'name')
+
+    def get_keys(self, record):
+        return get_word_keys(record.name)
+
+
+class ManufacturerIndex(NameIndex):
+    model = AssetManufacturer
+
+
+class ModelIndex(NameIndex):
+    model = AssetModel
+    fields = ('id', 'name', 'manufacturer')
+
+
+class WarehouseIndex(NameIndex):
+    model = Warehouse
+
+
+class AssetIndex(AutocompleteIndex):
+    """Assets with device info which aren't deleted, matched by prefixes of
+    their serial numbers and barcodes, and looked up by their models.
+
+    Nothing is kept while there are more of them than
+    ``ASSETS_AUTOCOMPLETE_MAX_ASSETS`` (see :meth:`is_available`). That's
+    checked when the index is loaded, i.e. on the first lookup of every
+    process and after deletes.
+    """
+
+    model = Asset
+    fields = ('id', 'sn', 'barcode', 'model', 'type', 'device_info', 'deleted')
+
+    def __init__(self):
+        super(AssetIndex, self).__init__()
+        self.by_model = {}
+        self.too_large = False
+
+    def get_queryset(self):
+        return Asset.admin_objects.filter(
+            deleted=False, device_info__isnull=False,
+        )
+
+    def get_changed_queryset(self, since):
+        return Asset.admin_objects.filter(modified__gte=since)
+
+    def get_keys(self, record):
+        return [fold(record.sn), fold(record.barcode)]
+
+    def is_indexed(self, record):
+        return not record.deleted and record.device_info is not None
+
+    def is_available(self):
+        """Refresh the index and return True if it holds the assets."""
+        with self.lock:
+            self.refresh()
+            return not self.too_large
+
+    def _load(self):
+        self.by_model = {}
+        self.too_large = self.get_queryset().count() > get_max_assets()
+        if self.too_large:
+            self.loaded_at = now()
+            self.records = {}
+            self.prefixes.load([])
+        else:
+            super(AssetIndex, self)._load()
+
+    def _update(self):
+        if self.too_large:
+            self.loaded_at = now()
+        else:
+            super(AssetIndex, self)._update()
+
+    def _add(self, record):
+        super(AssetIndex, self)._add(record)
+        self.by_model.setdefault(record.model, set()).add(record.id)
+
+    def _remove(self, item_id):
+        record = self.records.get(item_id)
+        if record is not None:
+            self.by_model.get(record.model, set()).discard(item_id)
+        super(AssetIndex, self)._remove(item_id)
+
+    def search_by_models(self, model_ids, limit, predicate=None,
+                         exclude=()):
+        """Return at most ``limit`` records of assets of ``model_ids``."""
+        with self.lock:
+            self.refresh()
+            results = []
+            for model_id in model_ids:
+                for item_id in sorted(self.by_model.get(model_id, ())):
+                    record = self.records[item_id]
+                    if item_id in exclude or (
+                        predicate is not None and not predicate(record)
+                    ):
+                        continue
+                    results.append(record)
+                    if len(results) == limit:
+                        return results
+            return results
+
+
+manufacturer_index = ManufacturerIndex()
+model_index = ModelIndex()
+warehouse_index = WarehouseIndex()
+asset_index = AssetIndex()
+
+for index in (manufacturer_index, model_index, warehouse_index, asset_index):
+    index.connect()
+
+
+def find_names(index, prefix, limit=10):
+    """Return records of ``index`` having a word starting with ``prefix``,
+    sorted by name."""
+    return sorted(
+        index.search(prefix, limit), key=lambda record: fold(record.name),
+    )
+
+
+def get_model_display(model_id):
+    """Return the model like ``unicode(AssetModel)`` does. The model and
+    manufacturer indexes should be refreshed before."""
+    model = model_index.records.get(model_id)
+    if model is None:
+        return ''
+    manufacturer = manufacturer_index.records.get(model.manufacturer)
+    return '{} {}'.format(
+        manufacturer.name if manufacturer else None, model.name,
+    )
+
+
+def find_devices(prefix, asset_types, limit=10):
+    """Return records of assets with device info of ``asset_types`` having
+    serial numbers or barcodes starting with ``prefix``, followed by the ones
+    having a model name with a word starting with it, or None if the assets
+    aren't indexed. The records have ``model`` replaced with its display."""
+
+    def predicate(record):
+        return record.type in asset_types
+
+    with asset_index.lock:
+        if not asset_index.is_available():
+            return None
+        results = asset_index.search(prefix, limit, predicate)
+        if len(results) < limit:
+            model_ids = [record.id for record in model_index.search(prefix)]
+            results.extend(asset_index.search_by_models(
+                model_ids,
+                limit - len(results),
+                predicate,
+                exclude=set(record.id for record in results),
+            ))
+    with model_index.lock:
+        with manufacturer_index.lock:
+            model_index.refresh()
+            manufacturer_index.refresh()
+            return [
+                Record(
+                    id=record.id,
+                    sn=record.sn,
+                    barcode=record.barcode,
+                    model=get_model_display(record.model),
+                ) for record in results
+            ]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Generation numbers of cached data.
+
+Data cached under keys including a generation number is invalidated at once
+by bumping the generation, without keeping track of the keys. Generations are
+kept in a Django cache, so all processes sharing it see the bump. Caches local
+to a process (see :func:`is_shared`) can't be used to invalidate data kept by
+other processes.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+GENERATION_TIMEOUT = 30 * 24 * 3600
+# backends keeping their data in the process
+LOCAL_BACKENDS = (DummyCache, LocMemCache)
+
+
+def is_shared(cache):
+    """Whether ``cache`` is seen by all processes, i.e. isn't kept in the
+    memory of the current one."""
+    return not isinstance(cache, LOCAL_BACKENDS)
+
+
+def get_generation(cache, key):
+    """Return the current generation stored under ``key`` in ``cache``."""
+    generation = cache.get(key)
+    if generation is None:
+        # a fresh number never used by data cached before an eviction
+        generation = int(time.time() * 1000)
+        if not cache.add(key, generation, GENERATION_TIMEOUT):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def bump_generation(cache, key):
+    """Start a new generation under ``key`` in ``cache``."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # not cached yet (or evicted), the next read starts a new one
+        pass
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""In-process cache of the asset category tree.
+
+The tree is small and read by every search. It's loaded once per process and
+reloaded when its generation, bumped on every change of a category, differs
+from the loaded one. The generation is kept in ``ASSETS_CATEGORY_CACHE``. If
+that cache is local to the process (like the default local memory one), other
+processes never see it bumped, so the tree is also reloaded once it's older
+than ``ASSETS_CATEGORY_CACHE_TIMEOUT`` seconds.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from ralph_assets.cache_util import bump_generation, get_generation, is_shared
+
+
+GENERATION_KEY = 'ralph_assets.categories.generation'
+NODE_FIELDS = (
+    'id', 'name', 'parent_id', 'type', 'is_blade', 'tree_id', 'lft', 'rght',
+    'level',
+)
+
+_tree = None
+
+
+def get_category_timeout():
+    """Number of seconds after which the tree is reloaded when its generation
+    isn't kept in a shared cache."""
+    return getattr(settings, 'ASSETS_CATEGORY_CACHE_TIMEOUT', 60)
+
+
+def get_category_cache():
+    """The cache holding the generation of the category tree: an alias from
+    ``CACHES`` or a backend path given in ``ASSETS_CATEGORY_CACHE``."""
+    return get_cache(getattr(settings, 'ASSETS_CATEGORY_CACHE', 'default'))
+
+
+class CategoryNode(object):
+    def __init__(self, id, name, parent_id, type, is_blade, tree_id, lft,
+                 rght, level):
+        self.id = id
+        self.name = name
+        self.parent_id = parent_id
+        self.type = type
+        self.is_blade = is_blade
+        self.tree_id = tree_id
+        self.lft = lft
+        self.rght = rght
+        self.level = level
+
+    def __unicode__(self):
+        return self.name
+
+
+class CategoryTree(object):
+    """Categories in tree order (``tree_id``, ``lft``)."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.by_id = dict((node.id, node) for node in nodes)
+
+    def get(self, category_id):
+        return self.by_id.get(category_id)
+
+
+def get_category_tree():
+    """Return the current :class:`CategoryTree`."""
+    global _tree
+    cache = get_category_cache()
+    generation = get_generation(cache, GENERATION_KEY)
+    if _tree is None or _tree[0] != generation or (
+        not is_shared(cache) and
+        time.time() - _tree[1] >= get_category_timeout()
+    ):
+        _tree = (generation, time.time(), _load_category_tree())
+    return _tree[2]
+
+
+def _load_category_tree():
+    # imported here, as models_assets invalidates the tree on changes
+    from ralph_assets.models_assets import AssetCategory
+    rows = AssetCategory.objects.order_by('tree_id', 'lft').values_list(
+        *NODE_FIELDS
+    )
+    return CategoryTree([CategoryNode(*row) for row in rows])
+
+
+def invalidate_category_tree():
+    """Make all processes reload the category tree."""
+    global _tree
+    _tree = None
+    bump_generation(get_category_cache(), GENERATION_KEY)
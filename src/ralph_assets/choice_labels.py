@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Labels of choice fields of asset models, as ``{id: label}`` dicts built
+once per field instead of scanning ``field.get_choices()`` for every value.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from ralph_assets.models_assets import (
+    Asset,
+    AssetCategory,
+    DeviceInfo,
+    OfficeInfo,
+    PartInfo,
+)
+
+
+_labels = {}
+
+
+def get_choice_labels(model, field_name):
+    """Return the ``{id: label}`` dict of the choice field ``field_name`` of
+    ``model``."""
+    labels = _labels.get((model, field_name))
+    if labels is None:
+        field = model._meta.get_field_by_name(field_name)[0]
+        labels = dict(field.flatchoices)
+        _labels[model, field_name] = labels
+    return labels
+
+
+def get_choice_label(model, field_name, value):
+    """Return the label of ``value`` of the choice field ``field_name`` of
+    ``model``, or None if it isn't a choice."""
+    return get_choice_labels(model, field_name).get(value)
+
+
+for model in (Asset, AssetCategory, DeviceInfo, OfficeInfo, PartInfo):
+    for field in model._meta.fields:
+        if field.choices:
+            get_choice_labels(model, field.name)
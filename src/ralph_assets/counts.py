@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Cached counts of asset search results.
+
+Cache keys include a generation number which is bumped whenever an asset or
+its device, office or part info changes, so all cached counts are invalidated
+at once without keeping track of their keys.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from ralph_assets.cache_util import bump_generation, get_generation
+
+
+GENERATION_KEY = 'ralph_assets.counts.generation'
+
+
+def get_count_cache():
+    """The cache holding counts: an alias from ``CACHES`` or a backend path
+    given in ``ASSETS_COUNT_CACHE``, e.g.
+    ``django.core.cache.backends.locmem.LocMemCache`` in tests."""
+    return get_cache(getattr(settings, 'ASSETS_COUNT_CACHE', 'default'))
+
+
+def get_count_timeout():
+    """Number of seconds after which cached counts expire. 0 disables
+    caching."""
+    return getattr(settings, 'ASSETS_COUNT_CACHE_TIMEOUT', 60)
+
+
+def get_cached_count(key_parts, count):
+    """Return the number of results identified by ``key_parts``, calling
+    ``count`` if it isn't cached."""
+    timeout = get_count_timeout()
+    if not timeout:
+        return count()
+    cache = get_count_cache()
+    digest = hashlib.md5('\x1f'.join(
+        unicode(part) for part in key_parts
+    ).encode('utf-8')).hexdigest()
+    key = 'ralph_assets.counts.{}.{}'.format(
+        get_generation(cache, GENERATION_KEY), digest,
+    )
+    value = cache.get(key)
+    if value is None:
+        value = count()
+        cache.set(key, value, timeout)
+    return value
+
+
+def invalidate_counts():
+    """Expire all cached counts."""
+    bump_generation(get_count_cache(), GENERATION_KEY)
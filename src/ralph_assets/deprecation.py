@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Deprecation of assets computed for many assets at once."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+from operator import itemgetter
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import Q
+from django.db.models.query import QuerySet
+
+from ralph_assets.models_util import CHUNK_SIZE, chunked_queryset
+
+
+DEPRECATION_FIELDS = ('invoice_date', 'deprecation_rate', 'force_deprecation')
+
+
+def get_deprecation_months(deprecation_rate):
+    """Return the number of months after which an asset with the given yearly
+    ``deprecation_rate`` (in percent) is deprecated."""
+    return int(
+        (1 / (deprecation_rate / 100) * 12)
+        if deprecation_rate else 0
+    )
+
+
+def get_deprecation_end_date(invoice_date, deprecation_rate):
+    """Return the date on which deprecation ends, or None if ``invoice_date``
+    is unknown. An asset is deprecated on every date after this one."""
+    if not invoice_date:
+        return None
+    return invoice_date + relativedelta(
+        months=get_deprecation_months(deprecation_rate),
+    )
+
+
+class Deprecation(object):
+    """Evaluates deprecation of many assets as of ``date``.
+
+    End dates are cached per invoice date and number of deprecation months,
+    which only take a handful of distinct values across a fleet, so large
+    batches don't pay for a ``relativedelta`` per asset.
+    """
+
+    def __init__(self, date=None):
+        self.date = date or datetime.date.today()
+        self._months = {}
+        self._end_dates = {}
+
+    def get_months(self, deprecation_rate):
+        try:
+            return self._months[deprecation_rate]
+        except KeyError:
+            months = get_deprecation_months(deprecation_rate)
+            self._months[deprecation_rate] = months
+            return months
+
+    def get_end_date(self, invoice_date, deprecation_rate):
+        if not invoice_date:
+            return None
+        key = invoice_date, self.get_months(deprecation_rate)
+        try:
+            return self._end_dates[key]
+        except KeyError:
+            end_date = invoice_date + relativedelta(months=key[1])
+            self._end_dates[key] = end_date
+            return end_date
+
+    def is_deprecated(self, invoice_date, deprecation_rate, force_deprecation):
+        if force_deprecation:
+            return True
+        end_date = self.get_end_date(invoice_date, deprecation_rate)
+        if end_date is None:
+            return False
+        return end_date < self.date
+
+    def evaluate(self, rows):
+        """Return a list of ``(is_deprecated, end_date)`` pairs, one for each
+        ``(invoice_date, deprecation_rate, force_deprecation)`` row. ``rows``
+        can also be a queryset of assets."""
+        if isinstance(rows, QuerySet):
+            rows = rows.values_list(*DEPRECATION_FIELDS)
+        return [
+            (
+                self.is_deprecated(invoice_date, rate, force),
+                self.get_end_date(invoice_date, rate),
+            ) for invoice_date, rate, force in rows
+        ]
+
+
+def get_deprecation_statuses(rows, date=None):
+    """Shortcut for :meth:`Deprecation.evaluate`."""
+    return Deprecation(date).evaluate(rows)
+
+
+def get_first_not_deprecated_invoice_date(months, date):
+    """Return the earliest invoice date for which an asset deprecated over
+    ``months`` months is still not deprecated on ``date``.
+
+    Adding months is monotonic in the invoice date, so assets with earlier
+    invoice dates are all deprecated and later ones are not. Month ends are
+    clamped by ``relativedelta`` which is why the candidate is corrected day by
+    day.
+    """
+    one_day = datetime.timedelta(days=1)
+    candidate = date - relativedelta(months=months)
+    while candidate + relativedelta(months=months) < date:
+        candidate += one_day
+    while (candidate - one_day) + relativedelta(months=months) >= date:
+        candidate -= one_day
+    return candidate
+
+
+def is_deprecated_by_end_date(deprecation_end_date, force_deprecation,
+                              date=None):
+    """Return True if an asset with the given stored deprecation end date is
+    deprecated on ``date``."""
+    if force_deprecation:
+        return True
+    if deprecation_end_date is None:
+        return False
+    return deprecation_end_date < (date or datetime.date.today())
+
+
+def get_deprecated_query(date=None):
+    """Return a ``Q`` object matching assets deprecated on ``date``, using the
+    stored (and indexed) ``deprecation_end_date`` column."""
+    date = date or datetime.date.today()
+    return Q(force_deprecation=True) | Q(deprecation_end_date__lt=date)
+
+
+def get_computed_deprecated_query(rates, date=None):
+    """Return a ``Q`` object matching assets deprecated on ``date`` computed
+    from ``invoice_date`` and ``deprecation_rate``, without relying on the
+    stored ``deprecation_end_date``.
+
+    ``rates`` is the collection of distinct deprecation rates present in the
+    searched assets (e.g. from ``values_list('deprecation_rate').distinct()``).
+    For each number of deprecation months the condition becomes a plain range
+    on ``invoice_date``, so no asset has to be loaded to filter on it.
+    """
+    date = date or datetime.date.today()
+    rates_by_months = {}
+    for rate in rates:
+        if rate:
+            rates_by_months.setdefault(
+                get_deprecation_months(rate), [],
+            ).append(rate)
+    query = Q(force_deprecation=True) | Q(
+        Q(deprecation_rate=None) | Q(deprecation_rate=0),
+        invoice_date__lt=get_first_not_deprecated_invoice_date(0, date),
+    )
+    for months, month_rates in rates_by_months.iteritems():
+        query |= Q(
+            deprecation_rate__in=month_rates,
+            invoice_date__lt=get_first_not_deprecated_invoice_date(
+                months, date,
+            ),
+        )
+    return query
+
+
+def find_deprecation_drift(queryset, date=None, chunk_size=CHUNK_SIZE):
+    """Yield ``(asset_id, stored_end_date, expected_end_date)`` for every
+    asset from ``queryset`` whose stored ``deprecation_end_date`` is out of
+    date, or whose deprecation judged by the stored column differs from the
+    one computed by ``Asset.is_deprecated``."""
+    deprecation = Deprecation(date)
+    rows = queryset.values_list(
+        'id', 'deprecation_end_date', *DEPRECATION_FIELDS
+    )
+    for chunk in chunked_queryset(rows, chunk_size, get_pk=itemgetter(0)):
+        for pk, stored, invoice_date, rate, force in chunk:
+            expected = deprecation.get_end_date(invoice_date, rate)
+            if stored != expected or is_deprecated_by_end_date(
+                stored, force, deprecation.date,
+            ) != deprecation.is_deprecated(invoice_date, rate, force):
+                yield pk, stored, expected
+
+
+def update_deprecation_end_dates(queryset, chunk_size=CHUNK_SIZE):
+    """Store the recomputed ``deprecation_end_date`` for drifted assets from
+    ``queryset``, bypassing ``save()``. Returns the number of fixed assets."""
+    pks_by_end_date = {}
+    for pk, stored, expected in find_deprecation_drift(
+        queryset, chunk_size=chunk_size,
+    ):
+        pks_by_end_date.setdefault(expected, []).append(pk)
+    updated = 0
+    for end_date, pks in pks_by_end_date.iteritems():
+        for i in xrange(0, len(pks), chunk_size):
+            updated += queryset.model._default_manager.filter(
+                pk__in=pks[i:i + chunk_size],
+            ).update(deprecation_end_date=end_date)
+    return updated
@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Streaming CSV export.
+
+Rows are encoded and written out one buffer at a time, so memory usage of an
+export doesn't depend on the number of exported assets. Exported columns are
+compiled into a single ``values_list`` query (see :class:`ExportPlan`), so
+rows are built from flat tuples instead of model instances.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import cStringIO
+import os
+import shutil
+import tempfile
+import time
+from operator import itemgetter
+
+import django_rq
+from bob.csvutil import UnicodeWriter
+from bob.data_table import DataTableMixin
+from django.conf import settings
+from django.core.servers.basehttp import FileWrapper
+from django.db.models.fields import FieldDoesNotExist
+from django.http import Http404, HttpResponse
+from django.utils.encoding import force_unicode
+
+from ralph.business.models import Venture
+from ralph.discovery.models_device import Device, DeviceType
+from ralph_assets.choice_labels import get_choice_labels
+from ralph_assets.models_assets import Asset, AssetModel, PartInfo
+from ralph_assets.models_util import CHUNK_SIZE, chunked_queryset
+from ralph_assets.progress import ProgressReporter, get_progress_interval
+
+
+CSV_ENCODING = 'cp1250'
+BUFFER_SIZE = 64 * 1024
+
+# Relations used by ``__unicode__`` of models exported through foreign keys.
+DISPLAY_RELATED = {
+    Asset: ('model__manufacturer',),
+    AssetModel: ('manufacturer',),
+}
+
+
+def get_export_partitions():
+    """Number of rq sub-jobs a DC export is split into. With 1 (default) the
+    export job renders everything itself."""
+    return getattr(settings, 'ASSETS_EXPORT_PARTITIONS', 1)
+
+
+def get_export_queue():
+    """Queue for partitions of exports. Partitions must have their own
+    workers, as the parent export job waits for them."""
+    return django_rq.get_queue(
+        getattr(settings, 'ASSETS_EXPORT_QUEUE', 'reports_partitions'),
+    )
+
+
+def get_export_dir():
+    """Return the directory for exports made by rq workers. It has to be
+    shared with the web workers serving the results."""
+    return getattr(settings, 'ASSETS_EXPORT_DIR', None) or (
+        tempfile.gettempdir()
+    )
+
+
+def iter_csv(rows, encoding=CSV_ENCODING, buffer_size=BUFFER_SIZE):
+    """Yield ``rows`` encoded as CSV (the same dialect and encoding as
+    ``bob.csvutil.make_csv_response``) in pieces of about ``buffer_size``
+    bytes."""
+    buf = cStringIO.StringIO()
+    writer = UnicodeWriter(buf, encoding=encoding)
+    for row in rows:
+        writer.writerow([unicode(item) for item in row])
+        if buf.tell() >= buffer_size:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def make_csv_response(rows, filename):
+    """Return a response streaming ``rows`` as a CSV attachment."""
+    response = HttpResponse(iter_csv(rows), content_type='application/csv')
+    response['Content-Disposition'] = 'attachment; filename=%s' % filename
+    return response
+
+
+def _make_export_file(directory=None):
+    return tempfile.mkstemp(
+        prefix='ralph_assets_', suffix='.csv',
+        dir=directory or get_export_dir(),
+    )
+
+
+def write_csv_file(rows, directory=None):
+    """Write ``rows`` as CSV to a new file in ``directory`` (the export
+    directory by default) and return its path."""
+    fd, path = _make_export_file(directory)
+    with os.fdopen(fd, 'wb') as f:
+        for data in iter_csv(rows):
+            f.write(data)
+    return path
+
+
+def _iter_and_remove(path):
+    with open(path, 'rb') as f:
+        for data in FileWrapper(f, BUFFER_SIZE):
+            yield data
+    os.remove(path)
+
+
+def make_csv_file_response(path, filename):
+    """Return a response streaming a file written by :func:`write_csv_file`.
+    The file is removed once it's been sent."""
+    if not os.path.isfile(path):
+        raise Http404
+    response = HttpResponse(
+        _iter_and_remove(path), content_type='application/csv',
+    )
+    response['Content-Disposition'] = 'attachment; filename=%s' % filename
+    return response
+
+
+class FieldCell(object):
+    """A model field of the asset or of an object related to it."""
+
+    def __init__(self, field, relation=None):
+        self.relation = relation
+        self.path = '{}__{}'.format(relation, field.name) if relation else (
+            field.name
+        )
+        self.paths = [self.path]
+        if relation:
+            self.paths.append(relation)
+        self.choices = get_choice_labels(
+            field.model, field.name,
+        ) if field.choices else None
+
+    def get_display(self, value, context):
+        return value
+
+    def format(self, row, context):
+        if self.relation and row[self.relation] is None:
+            return ''
+        value = row[self.path]
+        cell = ''
+        if self.choices is not None:
+            cell = force_unicode(
+                self.choices.get(value, value), strings_only=True,
+            )
+        if not cell:
+            cell = self.get_display(value, context)
+        return unicode(cell)
+
+
+class ForeignKeyCell(FieldCell):
+    """A foreign key, displayed as the related object."""
+
+    def __init__(self, field, relation=None):
+        super(ForeignKeyCell, self).__init__(field, relation)
+        self.related_model = field.rel.to
+
+    def get_display(self, value, context):
+        if value is None:
+            return None
+        return context.get_display(self.related_model, value)
+
+
+class ConstantCell(object):
+    paths = []
+
+    def __init__(self, value=''):
+        self.value = value
+
+    def format(self, row, context):
+        return self.value
+
+
+class VentureCell(object):
+    """``Asset.venture``."""
+
+    paths = ['device_info__ralph_device_id']
+    devices = True
+
+    def format(self, row, context):
+        return unicode(context.get_venture(row[self.paths[0]]))
+
+
+class VentureFieldCell(VentureCell):
+    """A field of ``Asset.venture``, formatted by the view's ``get_cell``."""
+
+    def __init__(self, field, get_cell):
+        self.field = field
+        self.get_cell = get_cell
+
+    def format(self, row, context):
+        return unicode(self.get_cell(
+            context.get_venture(row[self.paths[0]]), self.field, Venture,
+        ))
+
+
+class DiscoveredCell(object):
+    """``Asset.is_discovered``."""
+
+    paths = [
+        'part_info',
+        'device_info__ralph_device_id',
+        'part_info__device__device_info__ralph_device_id',
+    ]
+    devices = True
+    parent_devices = True
+
+    def format(self, row, context):
+        if row['part_info'] is not None:
+            ralph_id = row['part_info__device__device_info__ralph_device_id']
+        else:
+            ralph_id = row['device_info__ralph_device_id']
+        model_type = context.get_model_type(ralph_id)
+        return unicode(
+            model_type is not None and model_type != DeviceType.unknown.id
+        )
+
+
+class ChunkContext(object):
+    """Related objects resolved in bulk for one chunk of exported rows."""
+
+    def __init__(self, plan, rows):
+        self.displays = {}
+        for model, cells in plan.foreign_key_cells.iteritems():
+            ids = set(row[cell.path] for row in rows for cell in cells)
+            ids.discard(None)
+            objects = model._base_manager.select_related(
+                *DISPLAY_RELATED.get(model, ())
+            ).in_bulk(ids) if ids else {}
+            self.displays[model] = dict(
+                (pk, unicode(obj)) for pk, obj in objects.iteritems()
+            )
+        self.devices = {}
+        if plan.devices:
+            ralph_ids = set(
+                row['device_info__ralph_device_id'] for row in rows
+            )
+            if plan.parent_devices:
+                ralph_ids.update(
+                    row['part_info__device__device_info__ralph_device_id']
+                    for row in rows
+                )
+            ralph_ids.discard(None)
+            if ralph_ids:
+                self.devices = Device.objects.select_related(
+                    'venture__department', 'model',
+                ).in_bulk(ralph_ids)
+
+    def get_display(self, model, pk):
+        return self.displays[model].get(pk)
+
+    def get_venture(self, ralph_id):
+        device = self.devices.get(ralph_id)
+        return device.venture if device else None
+
+    def get_model_type(self, ralph_id):
+        device = self.devices.get(ralph_id)
+        if not device or not device.model:
+            return None
+        return device.model.type
+
+
+class ExportPlan(object):
+    """Exported ``columns`` compiled into a projection and cell formatters.
+
+    Columns are interpreted the same way as by ``AssetSearch.get_csv_rows``
+    used to do against model instances: ``foreign_field_name`` selects the
+    related object (``nested_name`` being the nested info of the searched
+    assets, e.g. ``device_info``), fields with choices are displayed by their
+    labels and foreign keys as the related objects. Related objects needed for
+    display, Ralph devices and ventures are fetched in bulk for every chunk.
+    """
+
+    def __init__(self, columns, nested_name, nested_model, get_cell=None):
+        self.nested_name = nested_name
+        self.nested_model = nested_model
+        self.get_cell = get_cell or DataTableMixin().get_cell
+        self.cells = [
+            self.compile_column(column) for column in columns if column.field
+        ]
+        self.paths = ['id', 'part_info']
+        for cell in self.cells:
+            for path in cell.paths:
+                if path not in self.paths:
+                    self.paths.append(path)
+        self.foreign_key_cells = {}
+        for cell in self.cells:
+            if isinstance(cell, ForeignKeyCell):
+                self.foreign_key_cells.setdefault(
+                    cell.related_model, [],
+                ).append(cell)
+        self.devices = any(
+            getattr(cell, 'devices', False) for cell in self.cells
+        )
+        self.parent_devices = any(
+            getattr(cell, 'parent_devices', False) for cell in self.cells
+        )
+
+    def compile_column(self, column):
+        nested_name = column.foreign_field_name
+        if nested_name == self.nested_name:
+            model, relation = self.nested_model, self.nested_name
+        elif nested_name == 'part_info':
+            model, relation = PartInfo, 'part_info'
+        elif nested_name == 'venture':
+            return VentureFieldCell(column.field, self.get_cell)
+        elif nested_name == 'is_discovered':
+            return DiscoveredCell()
+        else:
+            model, relation = Asset, None
+        try:
+            field, _, direct, m2m = model._meta.get_field_by_name(column.field)
+        except FieldDoesNotExist:
+            if model is Asset and column.field == 'venture':
+                return VentureCell()
+            if hasattr(model, column.field):
+                raise ValueError(
+                    "Column {!r} can't be exported.".format(column.field),
+                )
+            return ConstantCell()
+        if not direct or m2m:
+            raise ValueError(
+                "Column {!r} can't be exported.".format(column.field),
+            )
+        if field.rel:
+            return ForeignKeyCell(field, relation)
+        return FieldCell(field, relation)
+
+    def get_chunks(self, queryset, chunk_size=CHUNK_SIZE):
+        """Yield lists of exported rows, one list for each chunk of assets
+        from ``queryset``, in its order."""
+        rows = queryset.values_list(*self.paths)
+        for chunk in chunked_queryset(rows, chunk_size, get_pk=itemgetter(0)):
+            chunk = [dict(zip(self.paths, values)) for values in chunk]
+            context = ChunkContext(self, chunk)
+            yield [
+                ['part' if row['part_info'] is not None else 'device'] + [
+                    cell.format(row, context) for cell in self.cells
+                ] for row in chunk
+            ]
+
+
+def get_partitions(queryset, partitions):
+    """Split ``queryset`` into at most ``partitions`` primary key ranges of
+    similar size. Returns a list of ``(start_pk, end_pk, count)``, ``end_pk``
+    being exclusive and ``None`` meaning unbounded."""
+    total = queryset.count()
+    if not total:
+        return [(None, None, 0)]
+    size = -(-total // partitions)
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    starts = [pks[offset] for offset in xrange(size, total, size)]
+    return [
+        (start, end, min(size, total - i * size))
+        for i, (start, end) in enumerate(zip([None] + starts, starts + [None]))
+    ]
+
+
+def export_partition(model, query, columns, nested_name, nested_model,
+                     start_pk, end_pk, count, directory):
+    """Render one partition of an export to a CSV file (without the header)
+    in ``directory`` and return its path. This is run as an rq job, hence the
+    queryset passed as its model and query."""
+    queryset = model._base_manager.all()
+    queryset.query = query
+    if start_pk is not None:
+        queryset = queryset.filter(pk__gte=start_pk)
+    if end_pk is not None:
+        queryset = queryset.filter(pk__lt=end_pk)
+    plan = ExportPlan(columns, nested_name, nested_model)
+    progress = ProgressReporter(count)
+
+    def get_rows():
+        for rows in plan.get_chunks(queryset):
+            for row in rows:
+                yield row
+            progress.advance(len(rows))
+
+    path = write_csv_file(get_rows(), directory)
+    progress.finish()
+    return path
+
+
+def write_partitioned_csv_file(queryset, header, columns, nested_name,
+                               nested_model, partitions, queue=None,
+                               poll_interval=None):
+    """Write a CSV export of ``queryset`` like :func:`write_csv_file` does,
+    rendering its primary key ranges in parallel rq jobs on ``queue``.
+
+    The current job waits for the partitions, reporting their aggregated
+    progress, and concatenates the partial files in order. Partial files are
+    written to a directory of their own, removed once the export is done or
+    has failed. When it fails, partitions still queued are cancelled and the
+    files of the ones still running go away with the directory.
+    """
+    queue = queue or get_export_queue()
+    if poll_interval is None:
+        poll_interval = get_progress_interval()
+    bounds = get_partitions(queryset, partitions)
+    parts_dir = tempfile.mkdtemp(prefix='ralph_assets_', dir=get_export_dir())
+    jobs = []
+    path = None
+    try:
+        for start_pk, end_pk, count in bounds:
+            jobs.append(queue.enqueue_call(
+                func=export_partition,
+                args=(
+                    queryset.model, queryset.query, columns, nested_name,
+                    nested_model, start_pk, end_pk, count, parts_dir,
+                ),
+                timeout=settings.RQ_TIMEOUT,
+            ))
+        progress = ProgressReporter(sum(count for _, _, count in bounds))
+        while True:
+            processed = 0
+            finished = True
+            for job, (_, _, count) in zip(jobs, bounds):
+                job.refresh()
+                if job.is_failed:
+                    raise RuntimeError(
+                        'Export partition {} failed.'.format(job.id),
+                    )
+                if job.is_finished:
+                    processed += count
+                else:
+                    finished = False
+                    processed += count * job.meta.get('progress', 0)
+            if finished:
+                break
+            progress.update(processed)
+            time.sleep(poll_interval)
+        path = write_csv_file([header])
+        with open(path, 'ab') as f:
+            for job in jobs:
+                with open(job.result, 'rb') as part:
+                    shutil.copyfileobj(part, f)
+    except Exception:
+        for job in jobs:
+            if not (job.is_finished or job.is_failed):
+                job.cancel()
+        if path is not None:
+            os.remove(path)
+        raise
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    progress.finish()
+    return path
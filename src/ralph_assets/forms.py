@@ -28,6 +28,7 @@ from django.utils.safestring import mark_safe
 from mptt.forms import TreeNodeChoiceField
 from bob.forms import DependencyForm, SHOW, Dependency
 
+from ralph_assets.categories import get_category_tree
 from ralph_assets.models import (
     Asset,
     AssetCategory,
@@ -53,6 +54,43 @@ LOOKUPS = {
 }
 
 
+def set_category_choices(field, mode):
+    """Fill the choices of a category ``field`` from the cached category tree
+    (only DC or BO categories for the given ``mode``), so rendering it takes
+    no queries when the tree is cached."""
+    category_type = {
+        'dc': AssetCategoryType.data_center.id,
+        'back_office': AssetCategoryType.back_office.id,
+    }.get(mode)
+    choices = []
+    if field.empty_label is not None:
+        choices.append(('', field.empty_label))
+    for node in get_category_tree().nodes:
+        if category_type is None or node.type == category_type:
+            choices.append((node.id, '{} {}'.format(
+                field.level_indicator * node.level, node.name,
+            )))
+    field.choices = choices
+
+
+class CategoryIds(frozenset):
+    """Ids of categories as ``Dependency`` values: listed as strings, like the
+    values of the category field, and containing the categories chosen in the
+    field."""
+
+    def __contains__(self, category):
+        return super(CategoryIds, self).__contains__(
+            unicode(getattr(category, 'pk', category)),
+        )
+
+
+def get_blade_system_ids():
+    return CategoryIds(
+        unicode(node.id) for node in get_category_tree().nodes
+        if node.is_blade
+    )
+
+
 class CodeWidget(TextInput):
     def render(self, name, value, attrs=None, choices=()):
         formatted = escape(value) if value else ''
@@ -327,8 +365,7 @@ def _sn_additional_validation(serial_numbers):
 class BaseAddAssetForm(DependencyForm, ModelForm):
     @property
     def dependencies(self):
-        blade_systems = AssetCategory.objects.filter(is_blade=True).all()
-        yield Dependency('slots', 'category', blade_systems, SHOW)
+        yield Dependency('slots', 'category', get_blade_system_ids(), SHOW)
 
     class Meta:
         model = Asset
@@ -410,10 +447,11 @@ class BaseAddAssetForm(DependencyForm, ModelForm):
             self.fields['category'].queryset = category.filter(
                 type=AssetCategoryType.back_office
             )
+        set_category_choices(self.fields['category'], mode)
 
     def clean_category(self):
         data = self.cleaned_data["category"]
-        if not data.parent:
+        if not data.parent_id:
             raise ValidationError(
                 _("Category must be selected from the subcategory")
             )
@@ -509,13 +547,14 @@ class BaseEditAssetForm(ModelForm):
             self.fields['category'].queryset = category.filter(
                 type=AssetCategoryType.back_office
             )
+        set_category_choices(self.fields['category'], mode)
 
     def clean_sn(self):
         return self.instance.sn
 
     def clean_category(self):
         data = self.cleaned_data["category"]
-        if not data.parent:
+        if not data.parent_id:
             raise ValidationError(
                 _("Category must be selected from the subcategory")
             )
@@ -753,6 +792,13 @@ class SearchAssetForm(Form):
                                  ('deprecated', 'Deprecated'), ],
         label='Deprecation'
     )
+    deprecated_as_of = DateField(
+        required=False, widget=DateWidget(attrs={
+            'placeholder': 'YYYY-MM-DD',
+            'data-collapsed': True,
+        }),
+        label="Deprecated as of",
+    )
     invoice_date_from = DateField(
         required=False, widget=DateWidget(attrs={
             'placeholder': 'Start YYYY-MM-DD',
@@ -800,6 +846,12 @@ class SearchAssetForm(Form):
             self.fields['category'].queryset = category.filter(
                 type=AssetCategoryType.back_office
             )
+        set_category_choices(self.fields['category'], mode)
+
+
+class QuickSearchForm(Form):
+    """A single box searching all text fields of assets."""
+    q = CharField(required=False, label='Search')
 
 
 class DeleteAssetConfirmForm(Form):
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Fuzzy lookup of assets which aren't linked to Ralph devices.
+
+Assets are ranked by the ``difflib.SequenceMatcher`` ratio of their serial
+number, barcode and model name to the query. Instead of scoring every asset,
+only a shortlist of candidates sharing the most n-grams with the query is
+scored: the ones found in the n-gram index of serial numbers and barcodes and
+the ones of models with the most similar names.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import difflib
+import heapq
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from ralph_assets.autocomplete import autocomplete_enabled, model_index
+from ralph_assets.models_assets import Asset, AssetModel
+from ralph_assets.models_search import (
+    AssetNgram,
+    NgramField,
+    get_ngrams,
+    ngrams_enabled,
+)
+from ralph_assets.unknown_devices import get_unknown_device_query
+
+
+FUZZY_LIMIT = 10
+
+
+def get_candidate_limit():
+    """Number of assets shortlisted from the n-gram index (and as many from
+    similar models) for exact scoring."""
+    return getattr(settings, 'ASSETS_FUZZY_CANDIDATES', 300)
+
+
+def normalize(value):
+    return (value or '').replace(' ', '').lower()
+
+
+def get_distance(query, sn, barcode, model_name):
+    """Return the ranking key of an asset: the inverse of its similarity
+    ratio to ``query``, 999 if they aren't similar at all."""
+    ratio = difflib.SequenceMatcher(
+        None,
+        normalize(''.join(part or '' for part in (sn, barcode, model_name))),
+        normalize(query),
+    ).ratio()
+    if ratio:
+        return 1 / ratio
+    return 999
+
+
+def rank_assets(rows, query, limit=FUZZY_LIMIT):
+    """Return ids of the ``limit`` rows of ``(id, sn, barcode, model name)``
+    closest to ``query``, keeping the order of ``rows`` for ties."""
+    return [row[0] for row in heapq.nsmallest(
+        limit, rows, key=lambda row: get_distance(query, *row[1:]),
+    )]
+
+
+def get_unlinked_assets():
+    """Assets which aren't parts and aren't linked to Ralph devices (or are
+    linked to devices of unknown type)."""
+    return Asset.objects.filter(
+        Q(device_info__ralph_device_id=None) | get_unknown_device_query(),
+    ).filter(part_info=None)
+
+
+def _get_model_names():
+    if autocomplete_enabled():
+        return [
+            (record.id, record.name) for record in model_index.get_records()
+        ]
+    return AssetModel.objects.values_list('id', 'name')
+
+
+def find_candidates(assets, query, limit):
+    """Return ids of assets from ``assets`` sharing the most n-grams with
+    ``query``: at most ``limit`` by serial number and barcode and at most
+    ``limit`` by model name. Returns None if the query has no n-grams or the
+    index isn't maintained."""
+    ngrams = get_ngrams(normalize(query))
+    if not ngrams or not ngrams_enabled():
+        return None
+    candidates = [row['asset'] for row in AssetNgram.objects.filter(
+        field__in=[
+            NgramField.id_from_name('sn'),
+            NgramField.id_from_name('barcode'),
+        ],
+        ngram__in=ngrams,
+        asset__in=assets.values('pk'),
+    ).values('asset').annotate(
+        hits=Count('id'),
+    ).order_by('-hits', 'asset')[:limit]]
+    models = []
+    for model_id, name in _get_model_names():
+        hits = len(ngrams & get_ngrams(normalize(name)))
+        if hits:
+            models.append((-hits, model_id))
+    if models:
+        model_ids = [model_id for hits, model_id in sorted(models)[:limit]]
+        candidates.extend(assets.filter(
+            model__in=model_ids,
+        ).exclude(pk__in=candidates).values_list('pk', flat=True)[:limit])
+    return candidates
+
+
+def fuzzy_search(assets, query, limit=FUZZY_LIMIT):
+    """Return at most ``limit`` assets from ``assets`` most similar to
+    ``query``, the most similar first.
+
+    Only the shortlist from :func:`find_candidates` is scored. Queries too
+    short for n-grams shortlist assets containing the query instead. Short
+    shortlists are filled up with other assets, so the ranking is the same
+    as scoring all assets when there are at most ``ASSETS_FUZZY_CANDIDATES``.
+    """
+    candidate_limit = get_candidate_limit()
+    candidates = find_candidates(assets, query, candidate_limit)
+    if candidates is None:
+        value = normalize(query)
+        candidates = assets.filter(
+            Q(sn__icontains=value) |
+            Q(barcode__icontains=value) |
+            Q(model__name__icontains=value)
+        ).order_by('pk').values_list('pk', flat=True)[:candidate_limit]
+    candidates = list(candidates)
+    if len(candidates) < candidate_limit:
+        # when there are few assets, all of them are scored
+        candidates.extend(assets.exclude(pk__in=candidates).order_by(
+            'pk',
+        ).values_list('pk', flat=True)[:candidate_limit - len(candidates)])
+    rows = assets.filter(pk__in=candidates).order_by('pk').values_list(
+        'id', 'sn', 'barcode', 'model__name',
+    )
+    ids = rank_assets(rows, query, limit)
+    objects = Asset.objects.select_related('model').in_bulk(ids)
+    return [objects[asset_id] for asset_id in ids if asset_id in objects]
@@ -6,31 +6,63 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
+import functools
+import threading
+import time
+
+from django.db.models.signals import post_delete, post_save
+
+from ralph_assets.choice_labels import get_choice_label
 from ralph_assets.models_assets import Asset
 
 
-def field_changes(instance, ignore=('id', 'ralph_device_id')):
+# displays of foreign key values kept by the resolver and for how long
+DISPLAY_CACHE_SIZE = 512
+DISPLAY_CACHE_TIMEOUT = 60
+
+# rows per INSERT, within the limit of 999 query parameters of SQLite
+HISTORY_BATCH_SIZE = 50
+
+_buffer = threading.local()
+
+
+def field_changes(
+    instance, ignore=('id', 'ralph_device_id', 'deprecation_end_date'),
+):
     """Yield the name, original value and new value for each changed field.
     Skip all insignificant fields and those passed in ``ignore``.
     When creating asset, the first asset status will be added into the history.
+    Original values of foreign keys are given as displays of their objects,
+    resolved with :data:`display_resolver`.
     """
     if isinstance(instance, Asset) and instance.cache_version == 0:
         yield 'status', '–', get_choices(instance, 'status', instance.status)
+    changes = []
+    related = {}
     for field, orig in instance.dirty_fields.iteritems():
         if field in ignore:
             continue
         if field in instance.insignificant_fields:
             continue
+        parent_model = None
         if field.endswith('_id'):
             field = field[:-3]
+            if field in ('office_info', 'device_info', 'part_info'):
+                continue
             parent_model = instance._meta.get_field_by_name(
                 field
             )[0].related.parent_model
-            try:
-                if orig is not None:
-                    orig = parent_model.objects.get(pk=orig)
-            except parent_model.DoesNotExist:
-                orig = None
+            if orig is not None:
+                related.setdefault(parent_model, set()).add(orig)
+        changes.append((field, orig, parent_model))
+    displays = dict(
+        (model, display_resolver.resolve(model, pks))
+        for model, pks in related.iteritems()
+    )
+    for field, orig, parent_model in changes:
+        if parent_model is not None and orig is not None:
+            orig = displays[parent_model].get(orig)
         try:
             new = getattr(instance, field)
         except AttributeError:
@@ -46,8 +78,122 @@ def field_changes(instance, ignore=('id', 'ralph_device_id')):
         yield field, orig, new
 
 
+class DisplayResolver(object):
+    """Resolves ``unicode()`` of objects by their models and primary keys in
+    batches, keeping the ``size`` most recently used ones for ``timeout``
+    seconds. Entries are dropped when their objects are saved or deleted in
+    this process."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.models = set()
+
+    def resolve(self, model, pks):
+        """Return a dict of displays of objects of ``model`` with ``pks``.
+        Missing objects are left out."""
+        displays = {}
+        missing = []
+        now = time.time()
+        with self.lock:
+            for pk in pks:
+                entry = self.entries.pop((model, pk), None)
+                if entry is None or entry[1] < now - self.timeout:
+                    missing.append(pk)
+                    continue
+                self.entries[model, pk] = entry
+                displays[pk] = entry[0]
+        if not missing:
+            return displays
+        self._connect(model)
+        objects = model.objects.in_bulk(missing)
+        with self.lock:
+            for pk, obj in objects.iteritems():
+                displays[pk] = unicode(obj)
+                self.entries[model, pk] = (displays[pk], now)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return displays
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _connect(self, model):
+        with self.lock:
+            if model in self.models:
+                return
+            self.models.add(model)
+        for signal in (post_save, post_delete):
+            signal.connect(
+                self._changed, sender=model, weak=False,
+                dispatch_uid='ralph_assets.history.display_resolver',
+            )
+
+    def _changed(self, sender, instance, **kwargs):
+        with self.lock:
+            self.entries.pop((sender, instance.pk), None)
+
+
+display_resolver = DisplayResolver(
+    size=DISPLAY_CACHE_SIZE, timeout=DISPLAY_CACHE_TIMEOUT,
+)
+
+
 def get_choices(instance, field, id):
-    choices = instance._meta.get_field_by_name(field)[0].get_choices()
-    for choice_id, value in choices:
-        if choice_id == id:
-            return value
+    return get_choice_label(type(instance), field, id)
+
+
+class buffered_history(object):
+    """Buffer history changes written within the block (or the decorated
+    function) and insert them with ``bulk_create`` when it exits without an
+    exception. Nested blocks are flushed by the outermost one. Use it inside
+    the transaction saving the objects, so the changes are inserted before
+    the commit::
+
+        with transaction.commit_on_success():
+            with buffered_history():
+                for asset in assets:
+                    asset.save()
+    """
+
+    def __enter__(self):
+        depth = getattr(_buffer, 'depth', 0)
+        if not depth:
+            _buffer.changes = []
+        _buffer.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _buffer.depth -= 1
+        if not _buffer.depth:
+            changes = _buffer.changes
+            _buffer.changes = None
+            if exc_type is None:
+                save_changes(changes)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with buffered_history():
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def write_history(changes):
+    """Save unsaved history ``changes``, or buffer them if it's done within
+    :class:`buffered_history`."""
+    if getattr(_buffer, 'depth', 0):
+        _buffer.changes.extend(changes)
+    else:
+        save_changes(changes)
+
+
+def save_changes(changes):
+    if changes:
+        type(changes[0]).set_owner_assets(changes)
+    for i in xrange(0, len(changes), HISTORY_BATCH_SIZE):
+        batch = changes[i:i + HISTORY_BATCH_SIZE]
+        type(batch[0]).objects.bulk_create(batch)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Archive of old asset history changes.
+
+Changes older than ``ASSETS_HISTORY_RETENTION_DAYS`` are moved in batches to
+the :class:`ArchivedAssetHistoryChange` table, which the edit pages never
+read. Since new changes are dated with the current time, every archived
+change is older than every change left in the hot table, so the history
+page lists hot changes first and only reads the archive for pages past them.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import transaction
+
+from ralph_assets.counts import get_cached_count, invalidate_counts
+from ralph_assets.history import HISTORY_BATCH_SIZE
+from ralph_assets.models_history import (
+    ArchivedAssetHistoryChange,
+    AssetHistoryChange,
+)
+
+
+ARCHIVE_BATCH_SIZE = 1000
+# fields of hot changes and the matching fields of archived ones
+HOT_FIELDS = (
+    'id', 'date', 'asset', 'device_info', 'part_info', 'office_info',
+    'owner_asset', 'user', 'field_name', 'old_value', 'new_value', 'comment',
+)
+ARCHIVED_FIELDS = (
+    'id', 'date', 'asset_id', 'device_info_id', 'part_info_id',
+    'office_info_id', 'owner_asset_id', 'user_id', 'field_name', 'old_value',
+    'new_value', 'comment',
+)
+
+
+def get_retention_days():
+    """Number of days history changes are kept in the hot table."""
+    return getattr(settings, 'ASSETS_HISTORY_RETENTION_DAYS', 365)
+
+
+def archive_history(before, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move changes dated before ``before`` to the archive, a transaction
+    per batch of ``batch_size``. Within a batch, changes are inserted and
+    deleted ``HISTORY_BATCH_SIZE`` at a time, like history is written, so
+    queries stay within the limit of parameters of SQLite. Changes without
+    an owner asset get the current owner of their info. Returns the number
+    of moved changes."""
+    moved = 0
+    while True:
+        with transaction.commit_on_success():
+            rows = list(AssetHistoryChange.objects.filter(
+                date__lt=before,
+            ).order_by('id').values_list(*HOT_FIELDS)[:batch_size])
+            if not rows:
+                break
+            for i in xrange(0, len(rows), HISTORY_BATCH_SIZE):
+                changes = [
+                    ArchivedAssetHistoryChange(
+                        **dict(zip(ARCHIVED_FIELDS, row))
+                    ) for row in rows[i:i + HISTORY_BATCH_SIZE]
+                ]
+                AssetHistoryChange.set_owner_assets(changes)
+                ArchivedAssetHistoryChange.objects.bulk_create(changes)
+                AssetHistoryChange.objects.filter(
+                    id__in=[change.id for change in changes],
+                ).delete()
+        moved += len(rows)
+        if len(rows) < batch_size:
+            break
+    if moved:
+        invalidate_counts()
+    return moved
+
+
+class HistoryTimeline(object):
+    """History changes of an asset, newest first: the hot ones followed by
+    the archived ones. Sliced by ``Paginator``, it only queries the archive
+    for slices reaching past the hot changes. The number of archived changes
+    is kept in the count cache."""
+
+    def __init__(self, asset_id, field_name=None):
+        self.asset_id = asset_id
+        self.field_name = field_name
+        self.hot = self._filter(
+            AssetHistoryChange.objects.filter(owner_asset=asset_id),
+        )
+        self.archived = self._filter(
+            ArchivedAssetHistoryChange.objects.filter(owner_asset_id=asset_id),
+        )
+        self._hot_count = None
+
+    def _filter(self, queryset):
+        if self.field_name is not None:
+            queryset = queryset.filter(field_name=self.field_name)
+        return queryset.order_by('-date', '-id')
+
+    def get_hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        return self._hot_count
+
+    def count(self):
+        return self.get_hot_count() + get_cached_count(
+            ('history_archive', self.asset_id, self.field_name),
+            self.archived.count,
+        )
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('History timelines only support slicing.')
+        start = key.start or 0
+        stop = key.stop
+        hot_count = self.get_hot_count()
+        changes = []
+        if start < hot_count:
+            changes.extend(self.hot[start:stop])
+        if stop is None or stop > hot_count:
+            changes.extend(self.archived[
+                max(start - hot_count, 0):
+                None if stop is None else stop - hot_count
+            ])
+        return changes
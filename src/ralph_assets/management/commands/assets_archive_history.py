@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ralph_assets.history_archive import (
+    ARCHIVE_BATCH_SIZE,
+    archive_history,
+    get_retention_days,
+)
+
+
+class Command(BaseCommand):
+    """Move asset history changes older than ASSETS_HISTORY_RETENTION_DAYS
+    (or --days) to the archive table in batches."""
+
+    help = __doc__
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--days',
+            type='int',
+            default=None,
+            help='Keep changes from this many last days.',
+        ),
+        make_option(
+            '--batch-size',
+            type='int',
+            default=ARCHIVE_BATCH_SIZE,
+            help='Number of changes moved in a transaction.',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = get_retention_days()
+        before = datetime.datetime.now() - datetime.timedelta(days=days)
+        moved = archive_history(before, options['batch_size'])
+        print('Archived {} changes older than {}.'.format(moved, before))
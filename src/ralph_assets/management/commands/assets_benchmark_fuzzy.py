@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ralph_assets.fuzzy import (
+    fuzzy_search,
+    get_distance,
+    get_unlinked_assets,
+)
+from ralph_assets.models_assets import (
+    Asset,
+    AssetManufacturer,
+    AssetModel,
+    AssetSource,
+    AssetType,
+    Warehouse,
+)
+from ralph_assets.models_search import rebuild_ngrams
+
+
+SN_PREFIX = 'FUZZYBENCH-'
+
+
+def old_lookup(query):
+    """The lookup before the n-gram shortlist: every unlinked asset
+    scored."""
+    assets = get_unlinked_assets().select_related('model').order_by('pk')
+    return sorted(assets, key=lambda asset: get_distance(
+        query, asset.sn, asset.barcode, asset.model.name,
+    ))[:10]
+
+
+def new_lookup(query):
+    return fuzzy_search(get_unlinked_assets(), query)
+
+
+def make_typo(value):
+    i = random.randrange(len(value))
+    return value[:i] + value[i + 1:]
+
+
+class Command(BaseCommand):
+    """Compare the speed and results of the old (full scan) and new
+    (n-gram shortlist) fuzzy asset lookups on synthetic assets. The assets
+    are created in a transaction which is rolled back afterwards."""
+
+    help = __doc__
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--assets',
+            type='int',
+            default=10000,
+            help='Number of synthetic assets.',
+        ),
+        make_option(
+            '--queries',
+            type='int',
+            default=20,
+            help='Number of lookups of each kind.',
+        ),
+    )
+
+    @transaction.commit_manually
+    def handle(self, *args, **options):
+        random.seed(0)
+        try:
+            sns = self.create_assets(options['assets'])
+            queries = [
+                make_typo(random.choice(sns)) for _ in
+                xrange(options['queries'])
+            ]
+            results = []
+            for name, lookup in (('old', old_lookup), ('new', new_lookup)):
+                start = time.time()
+                found = [
+                    [asset.pk for asset in lookup(query)]
+                    for query in queries
+                ]
+                elapsed = (time.time() - start) / len(queries)
+                results.append(found)
+                print('{}: {:.1f} ms per lookup'.format(name, elapsed * 1000))
+            same = sum(1 for old, new in zip(*results) if old == new)
+            same_top = sum(
+                1 for old, new in zip(*results) if old[:1] == new[:1]
+            )
+            print('Same top 10: {} of {} lookups, same best match: {}.'.format(
+                same, len(queries), same_top,
+            ))
+        finally:
+            transaction.rollback()
+
+    def create_assets(self, count):
+        manufacturer = AssetManufacturer.objects.create(name='Benchmark')
+        models = [
+            AssetModel.objects.create(
+                name='Benchmark {} R{}'.format(series, i),
+                manufacturer=manufacturer,
+            )
+            for series in ('PowerEdge', 'ProLiant', 'ThinkPad')
+            for i in xrange(10)
+        ]
+        warehouse = Warehouse.objects.create(name='Benchmark')
+        sns = [
+            '{}{:08X}'.format(SN_PREFIX, random.getrandbits(32))
+            for _ in xrange(count)
+        ]
+        sns = list(set(sns))
+        Asset.objects.bulk_create([
+            Asset(
+                type=AssetType.back_office.id,
+                model=random.choice(models),
+                source=AssetSource.shipment.id,
+                sn=sn,
+                barcode='BC{:010d}'.format(i),
+                support_type='standard',
+                warehouse=warehouse,
+            ) for i, sn in enumerate(sns)
+        ])
+        rebuild_ngrams(Asset.admin_objects.filter(sn__startswith=SN_PREFIX))
+        return sns
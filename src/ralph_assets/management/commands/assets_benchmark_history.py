@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ralph_assets.choice_labels import get_choice_label
+from ralph_assets.history import field_changes
+from ralph_assets.models_assets import (
+    Asset,
+    AssetSource,
+    AssetStatus,
+    AssetType,
+)
+
+
+CHOICE_FIELDS = ('type', 'status', 'source')
+
+
+def scan_choice_label(instance, field, id):
+    """The label lookup before the registry: a scan of the field's
+    choices."""
+    choices = instance._meta.get_field_by_name(field)[0].get_choices()
+    for choice_id, value in choices:
+        if choice_id == id:
+            return value
+
+
+class Command(BaseCommand):
+    """Measure history generation for a bulk edit of the type, status and
+    source of unsaved assets, and the choice label lookups in it done by
+    scanning the choices of fields and with the label registry."""
+
+    help = __doc__
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--assets',
+            type='int',
+            default=10000,
+            help='Number of edited assets.',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        assets = []
+        for _ in xrange(options['assets']):
+            asset = Asset(
+                type=AssetType.data_center.id,
+                status=AssetStatus.new.id,
+                source=AssetSource.shipment.id,
+            )
+            asset.type = AssetType.back_office.id
+            asset.status = AssetStatus.in_progress.id
+            asset.source = AssetSource.salvaged.id
+            assets.append(asset)
+        for name, get_label in (
+            ('scan', scan_choice_label),
+            ('registry', lambda instance, field, id: get_choice_label(
+                type(instance), field, id,
+            )),
+        ):
+            start = time.time()
+            for asset in assets:
+                for field in CHOICE_FIELDS:
+                    get_label(asset, field, getattr(asset, field))
+            self.report('{} labels'.format(name), start, len(assets))
+        start = time.time()
+        changes = sum(len(list(field_changes(asset))) for asset in assets)
+        self.report('field_changes', start, len(assets))
+        print('{} changes of {} assets.'.format(changes, len(assets)))
+
+    def report(self, name, start, count):
+        print('{}: {:.1f} us per asset'.format(
+            name, (time.time() - start) / count * 1000000,
+        ))
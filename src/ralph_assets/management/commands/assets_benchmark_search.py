@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from ralph_assets.models_assets import (
+    Asset,
+    AssetManufacturer,
+    AssetModel,
+    AssetSource,
+    AssetType,
+    Warehouse,
+)
+from ralph_assets.models_search import rebuild_ngrams
+from ralph_assets.search import QUOTATION_MARKS, asset_search
+
+
+SN_PREFIX = 'SEARCHBENCH-'
+BATCH_SIZE = 1000
+# lookups of text parameters before the search compiler
+OLD_LOOKUPS = {
+    'sn': 'sn__icontains',
+    'barcode': 'barcode__contains',
+    'niw': 'niw__icontains',
+    'invoice_no': 'invoice_no__icontains',
+}
+
+
+def old_query(name, value):
+    """The query built by the old ``if/elif`` chain: quoted values matched
+    exactly, other ones by substring."""
+    if QUOTATION_MARKS.search(value):
+        return Q(**{name: value[1:-1]})
+    return Q(**{OLD_LOOKUPS[name]: value.rstrip('*')})
+
+
+def new_query(name, value):
+    return asset_search.compile({name: value}).query
+
+
+class Command(BaseCommand):
+    """Compare the speed and results of the old (substring) and compiled
+    asset search lookups of text parameters on synthetic assets. The assets
+    are created in a transaction which is rolled back afterwards."""
+
+    help = __doc__
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--assets',
+            type='int',
+            default=500000,
+            help='Number of synthetic assets.',
+        ),
+        make_option(
+            '--queries',
+            type='int',
+            default=20,
+            help='Number of searches of each kind.',
+        ),
+    )
+
+    @transaction.commit_manually
+    def handle(self, *args, **options):
+        random.seed(0)
+        try:
+            assets = self.create_assets(options['assets'])
+            for kind, make_value in (
+                ('exact', lambda value: '"{}"'.format(value)),
+                ('prefix', lambda value: '{}*'.format(value[:-3])),
+                ('contains', lambda value: value[-8:-2]),
+            ):
+                for name in ('sn', 'barcode', 'niw', 'invoice_no'):
+                    values = [
+                        make_value(random.choice(assets)[name])
+                        for _ in xrange(options['queries'])
+                    ]
+                    self.compare(kind, name, values)
+        finally:
+            transaction.rollback()
+
+    def compare(self, kind, name, values):
+        results = []
+        timings = []
+        for get_query in (old_query, new_query):
+            start = time.time()
+            results.append([
+                sorted(Asset.objects.filter(
+                    get_query(name, value),
+                ).values_list('pk', flat=True))
+                for value in values
+            ])
+            timings.append((time.time() - start) / len(values) * 1000)
+        same = sum(1 for old, new in zip(*results) if old == new)
+        print(
+            '{} {}: old {:.1f} ms, new {:.1f} ms per search, same results '
+            'for {} of {} ({})'.format(
+                kind, name, timings[0], timings[1], same, len(values),
+                asset_search.compile({name: values[0]}),
+            ),
+        )
+
+    def create_assets(self, count):
+        manufacturer = AssetManufacturer.objects.create(name='Benchmark')
+        model = AssetModel.objects.create(
+            name='Benchmark', manufacturer=manufacturer,
+        )
+        warehouse = Warehouse.objects.create(name='Benchmark')
+        assets = [
+            {
+                'sn': '{}{:08X}{:07d}'.format(
+                    SN_PREFIX, random.getrandbits(32), i,
+                ),
+                'barcode': 'BC{:010d}'.format(i),
+                'niw': 'NIW{:08d}'.format(random.randrange(10 ** 8)),
+                'invoice_no': 'FV/{:06d}'.format(random.randrange(10 ** 6)),
+            } for i in xrange(count)
+        ]
+        for start in xrange(0, count, BATCH_SIZE):
+            Asset.objects.bulk_create([
+                Asset(
+                    type=AssetType.data_center.id,
+                    model=model,
+                    source=AssetSource.shipment.id,
+                    support_type='standard',
+                    warehouse=warehouse,
+                    **values
+                ) for values in assets[start:start + BATCH_SIZE]
+            ])
+        rebuild_ngrams(Asset.admin_objects.filter(sn__startswith=SN_PREFIX))
+        return assets
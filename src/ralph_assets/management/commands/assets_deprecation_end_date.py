@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ralph_assets.deprecation import (
+    find_deprecation_drift,
+    update_deprecation_end_dates,
+)
+from ralph_assets.models_assets import Asset
+
+
+class Command(BaseCommand):
+    """Report assets whose stored deprecation end date drifted from the one
+    computed from their invoice date and deprecation rate. With ``--fix``
+    the stored dates are backfilled."""
+
+    help = __doc__
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--fix',
+            action='store_true',
+            dest='fix',
+            default=False,
+            help='Store the recomputed deprecation end dates.',
+        ),
+        make_option(
+            '--date',
+            dest='date',
+            default=None,
+            help='Compare deprecation on this date (YYYY-MM-DD), '
+                 'defaults to today.',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        queryset = Asset.admin_objects.all()
+        if options['fix']:
+            updated = update_deprecation_end_dates(queryset)
+            print('Updated {} assets.'.format(updated))
+            return
+        date = None
+        if options['date']:
+            try:
+                date = datetime.datetime.strptime(
+                    options['date'], '%Y-%m-%d',
+                ).date()
+            except ValueError:
+                raise CommandError('Invalid date: {}'.format(options['date']))
+        drifted = 0
+        for pk, stored, expected in find_deprecation_drift(queryset, date):
+            drifted += 1
+            print('Asset {}: stored {}, expected {}'.format(
+                pk, stored, expected,
+            ))
+        print('{} assets with drifted deprecation end date.'.format(drifted))
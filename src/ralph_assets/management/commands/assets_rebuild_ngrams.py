@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ralph_assets.models_assets import Asset
+from ralph_assets.models_search import rebuild_ngrams
+
+
+class Command(BaseCommand):
+    """Rebuild the n-gram index used by substring searches of serial
+    numbers, barcodes and inventory numbers."""
+
+    help = __doc__
+
+    def handle(self, *args, **options):
+        indexed = rebuild_ngrams(Asset.admin_objects.all())
+        print('Indexed {} assets.'.format(indexed))
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ralph_assets.models_assets import Asset
+from ralph_assets.models_search import rebuild_search_documents
+
+
+class Command(BaseCommand):
+    """Rebuild the search documents used by quick search. Needed after
+    renaming models or manufacturers, which doesn't update the documents of
+    their assets."""
+
+    help = __doc__
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_documents(Asset.admin_objects.all())
+        print('Indexed {} assets.'.format(indexed))
@@ -6,12 +6,19 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import difflib
-
 from ajax_select import LookupChannel
 from django.utils.html import escape
 from django.db.models import Q
 
+from ralph_assets.autocomplete import (
+    autocomplete_enabled,
+    find_devices,
+    find_names,
+    manufacturer_index,
+    model_index,
+    warehouse_index,
+)
+from ralph_assets.fuzzy import fuzzy_search, get_unlinked_assets
 from ralph_assets.models_assets import (
     Asset,
     AssetCategory,
@@ -27,14 +34,29 @@ from ralph_assets.models_assets import (
     PartInfo,
     Warehouse,
 )
-from ralph_assets.models_history import AssetHistoryChange
-from ralph.discovery.models import Device, DeviceType
+from ralph_assets.models_history import (
+    ArchivedAssetHistoryChange,
+    AssetHistoryChange,
+)
+from ralph_assets.models_search import (
+    AssetNgram,
+    AssetSearchDocument,
+    AssetSearchToken,
+)
+from ralph.discovery.models import Device
 
 
 class DeviceLookup(LookupChannel):
     model = Asset
+    asset_types = [
+        choice.id for choice in AssetType.DC.choices + AssetType.BO.choices
+    ]
 
     def get_query(self, q, request):
+        if autocomplete_enabled():
+            records = find_devices(q, self.asset_types)
+            if records is not None:
+                return records
         query = Q(
             Q(device_info__gt=0) & Q(
                 Q(barcode__istartswith=q) |
@@ -113,6 +135,8 @@ class AssetModelLookup(LookupChannel):
     model = AssetModel
 
     def get_query(self, q, request):
+        if autocomplete_enabled():
+            return find_names(model_index, q)
         return AssetModel.objects.filter(
             Q(name__icontains=q)
         ).order_by('name')[:10]
@@ -128,27 +152,31 @@ class AssetModelLookup(LookupChannel):
 
 
 class AssetManufacturerLookup(LookupChannel):
-    model = AssetModel
+    model = AssetManufacturer
 
     def get_query(self, q, request):
-        return AssetModel.objects.filter(
-            Q(manufacturer__name__icontains=q)
-        ).order_by('manufacturer__name')[:10]
+        if autocomplete_enabled():
+            return find_names(manufacturer_index, q)
+        return AssetManufacturer.objects.filter(
+            Q(name__icontains=q)
+        ).order_by('name')[:10]
 
     def get_result(self, obj):
-        return obj.manufacturer.name
+        return obj.name
 
     def format_match(self, obj):
         return self.format_item_display(obj)
 
     def format_item_display(self, obj):
-        return '{}'.format(escape(obj.manufacturer.name))
+        return '{}'.format(escape(obj.name))
 
 
 class WarehouseLookup(LookupChannel):
     model = Warehouse
 
     def get_query(self, q, request):
+        if autocomplete_enabled():
+            return find_names(warehouse_index, q)
         return Warehouse.objects.filter(
             Q(name__icontains=q)
         ).order_by('name')[:10]
@@ -164,47 +192,22 @@ class WarehouseLookup(LookupChannel):
 
 
 class DCDeviceLookup(DeviceLookup):
+    asset_types = [choice.id for choice in AssetType.DC.choices]
+
     def get_base_objects(self):
         return Asset.objects_dc
 
 
 class BODeviceLookup(DeviceLookup):
+    asset_types = [choice.id for choice in AssetType.BO.choices]
+
     def get_base_objects(self):
         return Asset.objects_bo
 
 
 class AssetLookupFuzzy(AssetLookup):
     def get_query(self, query, request):
-        dev_ids = Device.objects.filter(
-            model__type=DeviceType.unknown,
-        ).values_list('id', flat=True)
-        assets = Asset.objects.select_related(
-            'model__name',
-        ).filter(
-            Q(device_info__ralph_device_id=None) |
-            Q(device_info__ralph_device_id__in=dev_ids),
-        ).filter(part_info=None)
-
-        def comparator(asset):
-            seq = "".join(
-                [part or '' for part in
-                    [
-                        asset.sn,
-                        asset.barcode,
-                        asset.model.name,
-                    ]]
-            ).replace(" ", "").lower()
-            ratio = difflib.SequenceMatcher(
-                None,
-                seq,
-                query.replace(" ", "").lower(),
-            ).ratio()
-            if ratio:
-                return 1 / ratio
-            return 999
-
-        assets = sorted(assets, key=comparator)
-        return assets[:10]
+        return fuzzy_search(get_unlinked_assets(), query)
 
     def format_match(self, obj):
         ret = obj.__unicode__()
@@ -231,4 +234,8 @@ __all__ = [
     'BODeviceLookup',
     'AssetModelLookup',
     'AssetHistoryChange',
+    'ArchivedAssetHistoryChange',
+    'AssetNgram',
+    'AssetSearchDocument',
+    'AssetSearchToken',
 ]
@@ -9,9 +9,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
-import datetime
 
-from dateutil.relativedelta import relativedelta
 from lck.django.choices import Choices
 from lck.django.common.models import (
     EditorTrackable,
@@ -27,11 +25,18 @@ from mptt.models import MPTTModel
 from uuid import uuid4
 
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.db.utils import DatabaseError
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
+from ralph_assets.categories import invalidate_category_tree
+from ralph_assets.counts import invalidate_counts
+from ralph_assets.deprecation import (
+    Deprecation,
+    get_deprecation_end_date,
+    get_deprecation_months,
+)
 from ralph.business.models import Venture
 from ralph.discovery.models_device import Device, DeviceType
 from ralph.discovery.models_util import SavingUser
@@ -228,6 +233,9 @@ class Asset(TimeTrackable, EditorTrackable, SavingUser, SoftDeletable):
     force_deprecation = models.BooleanField(help_text=(
         'Check if you no longer want to bill for this asset'
     ))
+    deprecation_end_date = models.DateField(
+        null=True, blank=True, db_index=True, editable=False,
+    )
     category = models.ForeignKey('AssetCategory', null=True, blank=True)
     production_year = models.PositiveSmallIntegerField(null=True, blank=True)
     slots = models.FloatField(
@@ -248,6 +256,10 @@ class Asset(TimeTrackable, EditorTrackable, SavingUser, SoftDeletable):
 
     @property
     def venture(self):
+        try:
+            return self._prefetched_venture
+        except AttributeError:
+            pass
         if not self.device_info or not self.device_info.ralph_device_id:
             return None
         try:
@@ -323,22 +335,21 @@ class Asset(TimeTrackable, EditorTrackable, SavingUser, SoftDeletable):
         self.saving_user = None
         super(Asset, self).__init__(*args, **kwargs)
 
-    def get_deprecation_months(self):
-        return int(
-            (1 / (self.deprecation_rate / 100) * 12)
-            if self.deprecation_rate else 0
+    def save(self, *args, **kwargs):
+        self.deprecation_end_date = get_deprecation_end_date(
+            self.invoice_date, self.deprecation_rate,
         )
+        return super(Asset, self).save(*args, **kwargs)
+
+    def get_deprecation_months(self):
+        return get_deprecation_months(self.deprecation_rate)
 
     def is_deprecated(self, date=None):
-        date = date or datetime.date.today()
-        if self.force_deprecation:
-            return True
-        if not self.invoice_date:
-            return False
-        deprecation_date = self.invoice_date + relativedelta(
-            months=self.get_deprecation_months(),
+        return Deprecation(date).is_deprecated(
+            self.invoice_date,
+            self.deprecation_rate,
+            self.force_deprecation,
         )
-        return deprecation_date < date
 
     def delete_with_info(self, *args, **kwargs):
         """
@@ -355,9 +366,13 @@ class Asset(TimeTrackable, EditorTrackable, SavingUser, SoftDeletable):
 
     @property
     def is_discovered(self):
+        try:
+            return self._prefetched_is_discovered
+        except AttributeError:
+            pass
         if self.part_info:
             if self.part_info.device:
-                return self.part_info.device.is_discovered()
+                return self.part_info.device.is_discovered
             return False
         dev = self.device_info.get_ralph_device()
         if not dev or not dev.model:
@@ -365,6 +380,79 @@ class Asset(TimeTrackable, EditorTrackable, SavingUser, SoftDeletable):
         return dev.model.type != DeviceType.unknown.id
 
 
+def prefetch_ventures(assets):
+    """Resolve ventures of many assets at once.
+
+    All Ralph devices linked to ``assets`` are fetched (together with their
+    ventures and departments) in a single query and the results are cached on
+    the assets, so that ``Asset.venture`` doesn't hit the database. Assets
+    should be fetched with ``select_related('device_info')``.
+    """
+    assets = list(assets)
+    ralph_device_ids = set()
+    for asset in assets:
+        if asset.device_info and asset.device_info.ralph_device_id:
+            ralph_device_ids.add(asset.device_info.ralph_device_id)
+    ventures = {}
+    if ralph_device_ids:
+        devices = Device.objects.select_related(
+            'venture__department',
+        ).filter(pk__in=ralph_device_ids)
+        ventures = dict((device.pk, device.venture) for device in devices)
+    for asset in assets:
+        if asset.device_info:
+            venture = ventures.get(asset.device_info.ralph_device_id)
+        else:
+            venture = None
+        asset._prefetched_venture = venture
+    return assets
+
+
+def prefetch_discovered(assets):
+    """Compute ``Asset.is_discovered`` of many assets at once.
+
+    Linked device infos, parent devices of parts and Ralph devices with their
+    model types are fetched with at most three queries, no matter how many
+    assets are given. The results are cached on the assets.
+    """
+    assets = list(assets)
+    device_info_ids = set()
+    part_info_ids = set()
+    for asset in assets:
+        if asset.part_info_id:
+            part_info_ids.add(asset.part_info_id)
+        elif asset.device_info_id:
+            device_info_ids.add(asset.device_info_id)
+    ralph_ids_by_device_info = {}
+    if device_info_ids:
+        ralph_ids_by_device_info = dict(DeviceInfo.admin_objects.filter(
+            id__in=device_info_ids,
+        ).values_list('id', 'ralph_device_id'))
+    ralph_ids_by_part_info = {}
+    if part_info_ids:
+        ralph_ids_by_part_info = dict(PartInfo.admin_objects.filter(
+            id__in=part_info_ids,
+        ).values_list('id', 'device__device_info__ralph_device_id'))
+    ralph_ids = set(ralph_ids_by_device_info.itervalues())
+    ralph_ids.update(ralph_ids_by_part_info.itervalues())
+    ralph_ids.discard(None)
+    model_types = {}
+    if ralph_ids:
+        model_types = dict(Device.objects.filter(
+            id__in=ralph_ids,
+        ).values_list('id', 'model__type'))
+    for asset in assets:
+        if asset.part_info_id:
+            ralph_id = ralph_ids_by_part_info.get(asset.part_info_id)
+        else:
+            ralph_id = ralph_ids_by_device_info.get(asset.device_info_id)
+        model_type = model_types.get(ralph_id)
+        asset._prefetched_is_discovered = (
+            model_type is not None and model_type != DeviceType.unknown.id
+        )
+    return assets
+
+
 @receiver(post_save, sender=Asset, dispatch_uid='ralph.create_asset')
 def create_asset_post_save(sender, instance, created, **kwargs):
     """When a new DC asset without a device linked to it is created, try to
@@ -479,3 +567,29 @@ class PartInfo(TimeTrackable, SavingUser, SoftDeletable):
         self.save_comment = None
         self.saving_user = None
         super(PartInfo, self).__init__(*args, **kwargs)
+
+
+def invalidate_counts_post_change(sender, **kwargs):
+    """Cached counts of search results are stale after any change."""
+    invalidate_counts()
+
+
+for model in (Asset, DeviceInfo, OfficeInfo, PartInfo):
+    for signal in (post_save, post_delete):
+        signal.connect(
+            invalidate_counts_post_change,
+            sender=model,
+            dispatch_uid='ralph_assets.counts',
+        )
+
+
+def invalidate_category_tree_post_change(sender, **kwargs):
+    invalidate_category_tree()
+
+
+for signal in (post_save, post_delete):
+    signal.connect(
+        invalidate_category_tree_post_change,
+        sender=AssetCategory,
+        dispatch_uid='ralph_assets.categories',
+    )
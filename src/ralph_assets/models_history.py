@@ -9,11 +9,12 @@ from __future__ import unicode_literals
 from datetime import datetime
 
 from django.db import models as db
+from django.db.models import Q
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
-from ralph_assets.history import field_changes
+from ralph_assets.history import field_changes, write_history
 from ralph_assets.models_assets import (
     Asset,
     DeviceInfo,
@@ -22,8 +23,17 @@ from ralph_assets.models_assets import (
 )
 
 
+INFO_FIELDS = ('device_info', 'part_info', 'office_info')
+
+
 class AssetHistoryChange(db.Model):
-    """Represent a single change of a asset."""
+    """Represent a single change of a asset.
+
+    ``owner_asset`` is the asset the change belongs to, also for changes of
+    its device, part and office info, so the history of an asset is read
+    with the composite indexes on ``(owner_asset, date)`` and
+    ``(owner_asset, field_name, date)`` created by the migration.
+    """
 
     date = db.DateTimeField(verbose_name=_("date"), default=datetime.now)
     asset = db.ForeignKey(
@@ -42,6 +52,10 @@ class AssetHistoryChange(db.Model):
         'OfficeInfo', verbose_name=_("office_info"), null=True,
         blank=True, default=None, on_delete=db.SET_NULL
     )
+    owner_asset = db.ForeignKey(
+        'Asset', related_name='history_changes', null=True, blank=True,
+        default=None, on_delete=db.SET_NULL, db_index=False,
+    )
     user = db.ForeignKey(
         'auth.User', verbose_name=_("user"), null=True,
         blank=True, default=None, on_delete=db.SET_NULL
@@ -61,19 +75,108 @@ class AssetHistoryChange(db.Model):
             self.user, self.date, self.id
         )
 
+    @classmethod
+    def set_owner_assets(cls, changes):
+        """Set ``owner_asset`` of unsaved ``changes`` of device, part and
+        office info to the assets they belong to, with a query per kind of
+        info."""
+        for field in INFO_FIELDS:
+            pending = [
+                change for change in changes
+                if change.owner_asset_id is None and
+                getattr(change, field + '_id') is not None
+            ]
+            if not pending:
+                continue
+            owners = dict(Asset.admin_objects.filter(**{
+                field + '__in': set(
+                    getattr(change, field + '_id') for change in pending
+                ),
+            }).values_list(field, 'id'))
+            for change in pending:
+                change.owner_asset_id = owners.get(
+                    getattr(change, field + '_id'),
+                )
+
+    @classmethod
+    def adopt_info_changes(cls, asset):
+        """Set ``asset`` as the owner of saved changes of its device, part
+        and office info which didn't belong to any asset yet.
+
+        Archived changes aren't adopted: the archive has no indexes on info
+        ids. Changes get the owner of their info when they're archived, so
+        only changes of infos which didn't belong to any asset for the whole
+        retention period stay without one.
+        """
+        query = Q()
+        for field in INFO_FIELDS:
+            info_id = getattr(asset, field + '_id')
+            if info_id is not None:
+                query |= Q(**{field: info_id})
+        if query:
+            cls.objects.filter(query, owner_asset=None).update(
+                owner_asset=asset.id,
+            )
+
+
+class ArchivedAssetHistoryChange(db.Model):
+    """A history change moved out of :class:`AssetHistoryChange` by the
+    ``assets_archive_history`` command, keeping its id.
+
+    Ids of assets and their infos are kept as plain numbers, so deleting them
+    doesn't touch the archive. The table has the same composite indexes on
+    ``(owner_asset_id, date)`` and ``(owner_asset_id, field_name, date)``,
+    created by its migration.
+    """
 
-@receiver(post_save, sender=Asset, dispatch_uid='ralph.history_assets')
-def asset_post_save(sender, instance, raw, using, **kwargs):
-    """A hook for creating ``HistoryChange`` entries when a asset changes."""
-    for field, orig, new in field_changes(instance):
+    id = db.IntegerField(primary_key=True)
+    date = db.DateTimeField(verbose_name=_("date"))
+    asset_id = db.IntegerField(null=True, blank=True)
+    device_info_id = db.IntegerField(null=True, blank=True)
+    part_info_id = db.IntegerField(null=True, blank=True)
+    office_info_id = db.IntegerField(null=True, blank=True)
+    owner_asset_id = db.IntegerField(null=True, blank=True)
+    user = db.ForeignKey(
+        'auth.User', verbose_name=_("user"), null=True, blank=True,
+        default=None, on_delete=db.SET_NULL, related_name='+',
+    )
+    field_name = db.CharField(max_length=64, default='')
+    old_value = db.CharField(max_length=255, default='')
+    new_value = db.CharField(max_length=255, default='')
+    comment = db.TextField(null=True)
+
+    class Meta:
+        verbose_name = _("archived history change")
+        verbose_name_plural = _("archived history changes")
+
+    def __unicode__(self):
+        return "{!r}.{!r} = {!r} -> {!r} on {!r} ({!r})".format(
+            self.owner_asset_id, self.field_name, self.old_value,
+            self.new_value, self.date, self.id,
+        )
+
+
+def _write_field_changes(instance, **kwargs):
+    write_history([
         AssetHistoryChange(
-            asset=instance,
             field_name=field,
             old_value=unicode(orig),
             new_value=unicode(new),
             user=instance.saving_user,
             comment=instance.save_comment,
-        ).save()
+            **kwargs
+        ) for field, orig, new in field_changes(instance)
+    ])
+
+
+@receiver(post_save, sender=Asset, dispatch_uid='ralph.history_assets')
+def asset_post_save(sender, instance, raw, using, **kwargs):
+    """A hook for creating ``HistoryChange`` entries when a asset changes."""
+    if kwargs.get('created') or any(
+        field + '_id' in instance.dirty_fields for field in INFO_FIELDS
+    ):
+        AssetHistoryChange.adopt_info_changes(instance)
+    _write_field_changes(instance, asset=instance, owner_asset=instance)
 
 
 @receiver(post_save, sender=DeviceInfo, dispatch_uid='ralph.history_assets')
@@ -81,15 +184,7 @@ def device_info_post_save(sender, instance, raw, using, **kwargs):
     """A hook for creating ``HistoryChange`` entries
     when a DeviceInfo changes.
     """
-    for field, orig, new in field_changes(instance):
-        AssetHistoryChange(
-            device_info=instance,
-            field_name=field,
-            old_value=unicode(orig),
-            new_value=unicode(new),
-            user=instance.saving_user,
-            comment=instance.save_comment,
-        ).save()
+    _write_field_changes(instance, device_info=instance)
 
 
 @receiver(post_save, sender=PartInfo, dispatch_uid='ralph.history_assets')
@@ -97,26 +192,10 @@ def part_info_post_save(sender, instance, raw, using, **kwargs):
     """A hook for creating ``HistoryChange`` entries
     when a PartInfo changes.
     """
-    for field, orig, new in field_changes(instance):
-        AssetHistoryChange(
-            part_info=instance,
-            field_name=field,
-            old_value=unicode(orig),
-            new_value=unicode(new),
-            user=instance.saving_user,
-            comment=instance.save_comment,
-        ).save()
+    _write_field_changes(instance, part_info=instance)
 
 
 @receiver(post_save, sender=OfficeInfo, dispatch_uid='ralph.history_assets')
 def office_info_post_save(sender, instance, raw, using, **kwargs):
     """A hook for creating ``HistoryChange`` entries when a Office changes."""
-    for field, orig, new in field_changes(instance):
-        AssetHistoryChange(
-            office_info=instance,
-            field_name=field,
-            old_value=unicode(orig),
-            new_value=unicode(new),
-            user=instance.saving_user,
-            comment=instance.save_comment,
-        ).save()
+    _write_field_changes(instance, office_info=instance)
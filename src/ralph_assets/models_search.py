@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Search indexes of assets.
+
+The indexes are kept up to date by ``post_save`` handlers. ``update()`` and
+``bulk_create()`` of querysets don't send ``post_save``, so assets changed
+that way stay stale in the indexes until they're saved again or the indexes
+are rebuilt (``assets_rebuild_ngrams``, ``assets_rebuild_search_documents``).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import re
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections, models as db, router
+from django.db.models import Q, Sum
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from lck.django.choices import Choices
+
+from ralph_assets.models_assets import (
+    Asset,
+    DeviceInfo,
+    OfficeInfo,
+    PartInfo,
+)
+from ralph_assets.models_util import CHUNK_SIZE, chunked_queryset
+
+
+NGRAM_SIZE = 3
+MAX_QUERY_NGRAMS = 8
+SEARCH_TOKEN_LENGTH = 64
+WORD_SEPARATORS = re.compile(r'\W+', re.UNICODE)
+
+# Values making up the search document of an asset and weights of their
+# tokens in quick search ranking.
+SEARCH_DOCUMENT_FIELDS = [
+    ('sn', 10),
+    ('barcode', 10),
+    ('niw', 8),
+    ('model__name', 5),
+    ('model__manufacturer__name', 5),
+    ('office_info__license_key', 5),
+    ('invoice_no', 4),
+    ('order_no', 4),
+    ('device_info__rack', 3),
+    ('part_info__barcode_salvaged', 3),
+    ('remarks', 1),
+]
+
+
+class NgramField(Choices):
+    _ = Choices.Choice
+
+    sn = _("sn")
+    barcode = _("barcode")
+    niw = _("niw")
+
+
+NGRAM_FIELDS = ('sn', 'barcode', 'niw')
+
+
+def get_ngrams(value, size=NGRAM_SIZE):
+    """Return the set of lowercase n-grams of ``value``."""
+    if not value:
+        return set()
+    value = value.lower()
+    return set(value[i:i + size] for i in xrange(len(value) - size + 1))
+
+
+def ngrams_enabled():
+    """Whether the n-gram index is maintained and used for substring search.
+
+    By default it's used unless assets are stored in PostgreSQL, which has
+    its own trigram indexes (``pg_trgm``) on these columns.
+    """
+    enabled = getattr(settings, 'ASSETS_SEARCH_NGRAMS', None)
+    if enabled is None:
+        connection = connections[router.db_for_read(Asset)]
+        enabled = connection.vendor != 'postgresql'
+    return enabled
+
+
+class AssetNgram(db.Model):
+    """An n-gram of an indexed text field of an asset. Substring searches look
+    up the assets having all n-grams of the searched value first.
+
+    The table has a composite index on ``(ngram, field, asset)`` created by
+    its migration.
+    """
+
+    asset = db.ForeignKey(Asset, related_name='ngrams')
+    field = db.PositiveSmallIntegerField(choices=NgramField())
+    ngram = db.CharField(max_length=NGRAM_SIZE)
+
+    def __unicode__(self):
+        return '{} {}: {}'.format(
+            self.asset_id, NgramField.name_from_id(self.field), self.ngram,
+        )
+
+
+def get_asset_ngrams(asset):
+    """Return the set of ``(field id, ngram)`` pairs indexed for ``asset``."""
+    return _get_ngram_pairs(getattr(asset, name) for name in NGRAM_FIELDS)
+
+
+def _get_ngram_pairs(values):
+    ngrams = set()
+    for name, value in zip(NGRAM_FIELDS, values):
+        field = NgramField.id_from_name(name)
+        for ngram in get_ngrams(value):
+            ngrams.add((field, ngram))
+    return ngrams
+
+
+def update_asset_ngrams(asset):
+    """Bring the n-grams of ``asset`` up to date."""
+    current = dict(
+        ((field, ngram), pk) for pk, field, ngram in
+        AssetNgram.objects.filter(asset=asset).values_list(
+            'id', 'field', 'ngram',
+        )
+    )
+    expected = get_asset_ngrams(asset)
+    stale = [pk for key, pk in current.iteritems() if key not in expected]
+    if stale:
+        AssetNgram.objects.filter(pk__in=stale).delete()
+    AssetNgram.objects.bulk_create([
+        AssetNgram(asset_id=asset.pk, field=field, ngram=ngram)
+        for field, ngram in expected if (field, ngram) not in current
+    ])
+
+
+def rebuild_ngrams(queryset, chunk_size=CHUNK_SIZE):
+    """Rebuild the n-grams of all assets from ``queryset`` in chunks. Returns
+    the number of indexed assets."""
+    rows = queryset.values_list('id', *NGRAM_FIELDS)
+    indexed = 0
+    for chunk in chunked_queryset(rows, chunk_size, get_pk=itemgetter(0)):
+        pks = [row[0] for row in chunk]
+        AssetNgram.objects.filter(asset__in=pks).delete()
+        AssetNgram.objects.bulk_create([
+            AssetNgram(asset_id=row[0], field=field, ngram=ngram)
+            for row in chunk for field, ngram in _get_ngram_pairs(row[1:])
+        ])
+        indexed += len(chunk)
+    return indexed
+
+
+def find_ngram_candidates(field_name, value, limit):
+    """Return a query of ids of assets whose ``field_name`` may contain
+    ``value`` (case-insensitively), to be used as a subquery, or None if the
+    index can't narrow the search down to at most ``limit`` assets."""
+    ngrams = sorted(get_ngrams(value))
+    if not ngrams or not ngrams_enabled():
+        return None
+    if len(ngrams) > MAX_QUERY_NGRAMS:
+        # a handful of n-grams is selective enough
+        step = (len(ngrams) - 1) / (MAX_QUERY_NGRAMS - 1)
+        ngrams = [ngrams[int(round(i * step))] for i in xrange(
+            MAX_QUERY_NGRAMS,
+        )]
+    field = NgramField.id_from_name(field_name)
+    candidates = AssetNgram.objects.filter(field=field, ngram=ngrams[0])
+    for ngram in ngrams[1:]:
+        candidates = candidates.filter(
+            asset__ngrams__field=field, asset__ngrams__ngram=ngram,
+        )
+    ids = candidates.values_list('asset', flat=True)
+    if ids[limit:limit + 1].exists():
+        return None
+    return ids
+
+
+class AssetSearchDocument(db.Model):
+    """All searchable values of an asset as text. Tokens of the asset are only
+    rewritten when its document changes."""
+
+    asset = db.OneToOneField(Asset, related_name='search_document')
+    text = db.TextField(blank=True)
+
+    def __unicode__(self):
+        return '{}: {}'.format(self.asset_id, self.text)
+
+
+class AssetSearchToken(db.Model):
+    """A word of the search document of an asset. Quick search matches tokens
+    by prefix and ranks assets by the sum of weights of matched tokens.
+
+    The table has a composite index on ``(token, asset)`` created by its
+    migration.
+    """
+
+    asset = db.ForeignKey(Asset, related_name='search_tokens')
+    token = db.CharField(max_length=SEARCH_TOKEN_LENGTH)
+    weight = db.PositiveSmallIntegerField()
+
+    def __unicode__(self):
+        return '{}: {} ({})'.format(self.asset_id, self.token, self.weight)
+
+
+def get_search_tokens(value):
+    """Return the set of lowercase tokens of ``value``: its words separated by
+    whitespace and their alphanumeric parts."""
+    tokens = set()
+    for word in unicode(value).lower().split():
+        tokens.add(word[:SEARCH_TOKEN_LENGTH])
+        tokens.update(
+            part[:SEARCH_TOKEN_LENGTH]
+            for part in WORD_SEPARATORS.split(word) if part
+        )
+    return tokens
+
+
+def _get_search_document(values):
+    """Return the text and ``{token: weight}`` dict of a document made of
+    ``values`` of :data:`SEARCH_DOCUMENT_FIELDS`."""
+    lines = []
+    weights = {}
+    for (path, weight), value in zip(SEARCH_DOCUMENT_FIELDS, values):
+        if value is None or value == '':
+            continue
+        lines.append('{}: {}'.format(path, value))
+        for token in get_search_tokens(value):
+            weights[token] = max(weight, weights.get(token, 0))
+    return '\n'.join(lines), weights
+
+
+def update_search_documents(asset_ids):
+    """Bring the search documents of assets with ``asset_ids`` up to date.
+    Only documents whose text changed are rewritten. Returns the number of
+    rewritten documents."""
+    asset_ids = list(asset_ids)
+    if not asset_ids:
+        return 0
+    rows = Asset.admin_objects.filter(pk__in=asset_ids).values_list(
+        'id', *_get_search_document_paths()
+    )
+    texts = dict(AssetSearchDocument.objects.filter(
+        asset__in=asset_ids,
+    ).values_list('asset_id', 'text'))
+    return _write_search_documents(rows, texts)
+
+
+def rebuild_search_documents(queryset, chunk_size=CHUNK_SIZE):
+    """Rebuild the search documents of all assets from ``queryset`` in chunks.
+    Returns the number of indexed assets."""
+    rows = queryset.values_list('id', *_get_search_document_paths())
+    indexed = 0
+    for chunk in chunked_queryset(rows, chunk_size, get_pk=itemgetter(0)):
+        indexed += _write_search_documents(chunk)
+    return indexed
+
+
+def _get_search_document_paths():
+    return [path for path, weight in SEARCH_DOCUMENT_FIELDS]
+
+
+def _write_search_documents(rows, texts=None):
+    """Write documents and tokens of ``rows`` of asset ids and document
+    values, skipping the ones having the same text in ``texts``."""
+    documents = []
+    tokens = []
+    for row in rows:
+        text, weights = _get_search_document(row[1:])
+        if texts is not None and texts.get(row[0]) == text:
+            continue
+        documents.append(AssetSearchDocument(asset_id=row[0], text=text))
+        tokens.extend(
+            AssetSearchToken(asset_id=row[0], token=token, weight=weight)
+            for token, weight in weights.iteritems()
+        )
+    if not documents:
+        return 0
+    changed = [document.asset_id for document in documents]
+    AssetSearchDocument.objects.filter(asset__in=changed).delete()
+    AssetSearchToken.objects.filter(asset__in=changed).delete()
+    AssetSearchDocument.objects.bulk_create(documents)
+    AssetSearchToken.objects.bulk_create(tokens)
+    return len(documents)
+
+
+def get_query_terms(query):
+    """Return the sorted lowercase words of a quick search ``query``."""
+    return sorted(set(
+        word[:SEARCH_TOKEN_LENGTH] for word in query.lower().split()
+    ))
+
+
+def quick_search(query, assets):
+    """Rank ``assets`` having tokens starting with every word of ``query``.
+
+    Returns a values queryset of ``{'asset': id, 'score': score}`` dicts
+    ordered by decreasing score, where the score is the sum of weights of the
+    tokens matched by the words.
+    """
+    terms = get_query_terms(query)
+    matched = Q()
+    for term in terms:
+        assets = assets.filter(search_tokens__token__startswith=term)
+        matched |= Q(token__startswith=term)
+    if not terms:
+        assets = assets.none()
+    return AssetSearchToken.objects.filter(
+        matched, asset__in=assets.values('pk'),
+    ).values('asset').annotate(score=Sum('weight')).order_by('-score', 'asset')
+
+
+@receiver(post_save, sender=Asset, dispatch_uid='ralph_assets.ngrams')
+def asset_ngrams_post_save(sender, instance, raw=False, **kwargs):
+    if not raw and ngrams_enabled():
+        update_asset_ngrams(instance)
+
+
+@receiver(
+    post_save, sender=Asset, dispatch_uid='ralph_assets.search_documents',
+)
+def asset_search_document_post_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_documents([instance.pk])
+
+
+@receiver(
+    post_save, sender=DeviceInfo,
+    dispatch_uid='ralph_assets.search_documents',
+)
+def device_info_search_document_post_save(sender, instance, raw=False,
+                                          **kwargs):
+    if not raw:
+        update_search_documents(Asset.admin_objects.filter(
+            device_info=instance,
+        ).values_list('id', flat=True))
+
+
+@receiver(
+    post_save, sender=OfficeInfo,
+    dispatch_uid='ralph_assets.search_documents',
+)
+def office_info_search_document_post_save(sender, instance, raw=False,
+                                          **kwargs):
+    if not raw:
+        update_search_documents(Asset.admin_objects.filter(
+            office_info=instance,
+        ).values_list('id', flat=True))
+
+
+@receiver(
+    post_save, sender=PartInfo, dispatch_uid='ralph_assets.search_documents',
+)
+def part_info_search_document_post_save(sender, instance, raw=False,
+                                        **kwargs):
+    if not raw:
+        update_search_documents(Asset.admin_objects.filter(
+            part_info=instance,
+        ).values_list('id', flat=True))
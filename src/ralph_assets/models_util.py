@@ -8,9 +8,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from operator import attrgetter
+
 from django.db import models as db
 
 
+CHUNK_SIZE = 1000
+
+
 class SavingUser(db.Model):
     class Meta:
         abstract = True
@@ -18,3 +23,66 @@ class SavingUser(db.Model):
     def save(self, user=None, *args, **kwargs):
         self.saving_user = user
         return super(SavingUser, self).save(*args, **kwargs)
+
+
+def chunked_queryset(queryset, chunk_size=CHUNK_SIZE,
+                     get_pk=attrgetter('pk')):
+    """Yield lists of at most ``chunk_size`` objects from ``queryset``.
+
+    Unless the queryset is ordered by something else than its primary key, it
+    is walked in primary key order, each chunk being fetched with a separate
+    ``WHERE pk > last_pk LIMIT chunk_size`` query, so only one chunk is held
+    in memory at a time and deep chunks are as cheap as the first one.
+    Otherwise the ordered primary keys are fetched once and chunks are
+    fetched by them, keeping the order of the queryset.
+
+    ``get_pk`` returns the primary key of a fetched row, e.g.
+    ``itemgetter(0)`` for a ``values_list('id', ...)`` queryset.
+    """
+    if is_ordered_by_other_fields(queryset):
+        for chunk in _chunked_by_ordered_pks(queryset, chunk_size, get_pk):
+            yield chunk
+        return
+    last_pk = None
+    while True:
+        chunk_qs = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk_qs = chunk_qs.filter(pk__gt=last_pk)
+        chunk = list(chunk_qs[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = get_pk(chunk[-1])
+
+
+def is_ordered_by_other_fields(queryset):
+    """Return True if ``queryset`` has an explicit ordering other than by
+    its primary key."""
+    pk_names = ('pk', queryset.model._meta.pk.name)
+    return any(
+        field.lstrip('-') not in pk_names
+        for field in queryset.query.order_by
+    )
+
+
+def _chunked_by_ordered_pks(queryset, chunk_size, get_pk):
+    pks = list(queryset.values_list('pk', flat=True))
+    for start in xrange(0, len(pks), chunk_size):
+        chunk_pks = pks[start:start + chunk_size]
+        rows = dict(
+            (get_pk(row), row)
+            for row in queryset.order_by().filter(pk__in=chunk_pks)
+        )
+        yield [rows[pk] for pk in chunk_pks if pk in rows]
+
+
+def iterate_queryset(queryset, chunk_size=CHUNK_SIZE):
+    """Yield objects from ``queryset`` fetched in chunks of ``chunk_size``.
+
+    See :func:`chunked_queryset`.
+    """
+    for chunk in chunked_queryset(queryset, chunk_size):
+        for obj in chunk:
+            yield obj
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Keyset (seek) pagination of querysets.
+
+Instead of ``OFFSET n``, every page is fetched with a condition on the sort
+key and id of the last (or first) row of the neighbouring page, so deep pages
+cost the same as the first one. Pages are addressed by opaque cursors instead
+of numbers.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import base64
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router
+from django.db.models import FieldDoesNotExist, Q
+
+from ralph_assets.counts import get_cached_count
+
+
+AFTER = 'after'
+BEFORE = 'before'
+
+
+def get_keyset_pagination():
+    """Whether asset search is paginated with cursors instead of page
+    numbers."""
+    return getattr(settings, 'ASSETS_SEARCH_KEYSET_PAGINATION', False)
+
+
+def get_count_limit():
+    """Number of rows up to which results of keyset paginated searches are
+    counted exactly. Bigger counts are only reported as exceeding it. None
+    counts all rows."""
+    return getattr(settings, 'ASSETS_SEARCH_COUNT_LIMIT', 10000)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(
+        json.dumps(values, cls=DjangoJSONEncoder),
+    )
+
+
+def decode_cursor(cursor):
+    """Return the ``[key, id]`` list encoded in ``cursor`` or None if it's
+    malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if (not isinstance(values, list) or len(values) != 2 or
+            not isinstance(values[1], (int, long))):
+        return None
+    return values
+
+
+def get_keyset_key(model, expression):
+    """Return ``expression`` if it's a path of a concrete field of ``model``
+    usable as a sort key, None otherwise. Foreign keys are compared by id,
+    as Django sorts them when the related model has no default ordering."""
+    if not expression:
+        return None
+    opts = model._meta
+    parts = expression.split('__')
+    for i, part in enumerate(parts):
+        try:
+            field, model, direct, m2m = opts.get_field_by_name(part)
+        except FieldDoesNotExist:
+            return None
+        if not direct or m2m:
+            return None
+        if i < len(parts) - 1:
+            if not field.rel:
+                return None
+            opts = field.rel.to._meta
+    return expression
+
+
+class CachedCountPaginator(Paginator):
+    """A page number paginator taking the number of objects from the count
+    cache under ``count_key`` (a tuple identifying the query)."""
+
+    def __init__(self, object_list, per_page, count_key, **kwargs):
+        super(CachedCountPaginator, self).__init__(
+            object_list, per_page, **kwargs
+        )
+        self.count_key = count_key
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = get_cached_count(
+                self.count_key,
+                super(CachedCountPaginator, self)._get_count,
+            )
+        return self._count
+    count = property(_get_count)
+
+
+class KeysetPage(object):
+    def __init__(self, object_list, paginator, has_next, has_previous,
+                 first_cursor, last_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.first_cursor = first_cursor
+        self.last_cursor = last_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def get_next_query(self, query):
+        """Return the urlencoded ``query`` pointing at the next page."""
+        return self._get_query(query, AFTER, self.last_cursor)
+
+    def get_previous_query(self, query):
+        """Return the urlencoded ``query`` pointing at the previous page."""
+        return self._get_query(query, BEFORE, self.first_cursor)
+
+    def _get_query(self, query, name, cursor):
+        query = query.copy()
+        for key in (AFTER, BEFORE, self.paginator.page_variable_name):
+            if key in query:
+                del query[key]
+        if cursor:
+            query[name] = cursor
+        return query.urlencode()
+
+
+class KeysetPaginator(object):
+    """Paginates ``queryset`` ordered by ``key`` (a field path, or None to
+    sort by id only) and id.
+
+    Rows with a NULL key are placed where the database sorts them: first in
+    ascending order, except for PostgreSQL and Oracle which put them last.
+    """
+
+    page_variable_name = 'page'
+
+    def __init__(self, queryset, per_page, key=None, descending=False,
+                 count_limit=None, count_key=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key = key
+        self.descending = descending
+        self.count_limit = count_limit
+        self.count_key = count_key
+        self._count = None
+        connection = connections[router.db_for_read(queryset.model)]
+        self.nulls_last = connection.vendor in ('postgresql', 'oracle')
+
+    @property
+    def count(self):
+        """Number of rows, at most ``count_limit`` + 1. With ``count_key``
+        set, it's taken from the count cache."""
+        if self._count is None:
+            if self.count_key is None:
+                self._count = self._get_count()
+            else:
+                self._count = get_cached_count(
+                    self.count_key + (self.count_limit,), self._get_count,
+                )
+        return self._count
+
+    def _get_count(self):
+        if self.count_limit is None:
+            return self.queryset.count()
+        # COUNT(*) of a sliced queryset still scans all rows
+        return len(self.queryset.values_list('pk', flat=True).order_by()[
+            :self.count_limit + 1
+        ])
+
+    @property
+    def count_exact(self):
+        return self.count_limit is None or self.count <= self.count_limit
+
+    def page(self, after=None, before=None):
+        """Return the page following the ``after`` cursor, preceding the
+        ``before`` one or the first page."""
+        cursor = None
+        backwards = False
+        if after:
+            cursor = decode_cursor(after)
+        elif before:
+            cursor = decode_cursor(before)
+            backwards = cursor is not None
+        descending = self.descending != backwards
+        queryset = self.queryset.order_by(*self._get_ordering(descending))
+        if cursor is not None:
+            queryset = queryset.filter(self._get_seek_query(
+                cursor[0], cursor[1], descending,
+            ))
+        fields = ['pk'] if self.key is None else [self.key, 'pk']
+        rows = list(queryset.values_list(*fields)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        if backwards and not more:
+            return self.page()
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        objects = self.queryset.in_bulk([row[-1] for row in rows])
+        object_list = [objects[row[-1]] for row in rows if row[-1] in objects]
+        return KeysetPage(
+            object_list,
+            self,
+            has_next=True if backwards else more,
+            has_previous=True if backwards else cursor is not None,
+            first_cursor=self._get_cursor(rows[0]) if rows else None,
+            last_cursor=self._get_cursor(rows[-1]) if rows else None,
+        )
+
+    def _get_cursor(self, row):
+        if self.key is None:
+            return encode_cursor([None, row[0]])
+        return encode_cursor(list(row))
+
+    def _get_ordering(self, descending):
+        sign = '-' if descending else ''
+        if self.key is None:
+            return [sign + 'pk']
+        return [sign + self.key, sign + 'pk']
+
+    def _get_seek_query(self, value, pk, descending):
+        """Return a ``Q`` object matching rows sorted after ``(value, pk)``."""
+        greater = 'lt' if descending else 'gt'
+        after_pk = Q(**{'pk__' + greater: pk})
+        if self.key is None:
+            return after_pk
+        nulls_at_end = self.nulls_last != descending
+        is_null = Q(**{self.key + '__isnull': True})
+        if value is None:
+            if nulls_at_end:
+                return is_null & after_pk
+            return (
+                (is_null & after_pk) |
+                Q(**{self.key + '__isnull': False})
+            )
+        query = (
+            Q(**{'{}__{}'.format(self.key, greater): value}) |
+            (Q(**{self.key: value}) & after_pk)
+        )
+        if nulls_at_end:
+            query |= is_null
+        return query
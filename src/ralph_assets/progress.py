@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Throttled progress reporting for long-running rq jobs."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from rq import get_current_job
+
+from ralph.util.reports import set_progress
+
+
+def get_progress_interval():
+    """Minimal number of seconds between two progress writes."""
+    return getattr(settings, 'ASSETS_PROGRESS_INTERVAL', 1)
+
+
+def get_progress_step():
+    """Progress change (0-1) after which progress is written regardless of
+    the interval."""
+    return getattr(settings, 'ASSETS_PROGRESS_STEP', 0.05)
+
+
+class ProgressReporter(object):
+    """Reports progress of processing ``total`` items to an rq ``job``
+    (the current one by default).
+
+    Every ``set_progress`` saves the whole job in Redis, so progress is only
+    written when ``interval`` seconds have passed or it advanced by ``step``
+    since the last write. Outside of rq jobs nothing is written.
+    """
+
+    def __init__(self, total, job=None, interval=None, step=None,
+                 clock=time.time):
+        self.total = total
+        self.job = job or get_current_job()
+        self.interval = (
+            get_progress_interval() if interval is None else interval
+        )
+        self.step = get_progress_step() if step is None else step
+        self.clock = clock
+        self.processed = 0
+        self.reported = None
+        self.reported_at = None
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 1
+        return min(self.processed / self.total, 1)
+
+    def advance(self, count=1):
+        self.processed += count
+        self.report()
+
+    def update(self, processed):
+        self.processed = processed
+        self.report()
+
+    def report(self, force=False):
+        if not self.job:
+            return
+        progress = self.progress
+        now = self.clock()
+        if not force and self.reported is not None and not (
+            now - self.reported_at >= self.interval or
+            progress - self.reported >= self.step
+        ):
+            return
+        self.job.meta.setdefault('start_progress', None)
+        set_progress(self.job, progress)
+        self.reported = progress
+        self.reported_at = now
+
+    def finish(self):
+        self.processed = max(self.processed, self.total)
+        self.report(force=True)
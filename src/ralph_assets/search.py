@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compilation of asset search parameters into a query.
+
+Every search parameter is described by a field in a registry, which decides
+the lookup used for a given value. The compiled :class:`SearchPlan` keeps the
+chosen lookups, so they can be logged and checked against the indexes.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import re
+
+from django.conf import settings
+from django.db.models import Q
+
+from ralph_assets.categories import get_category_tree
+from ralph_assets.deprecation import get_deprecated_query
+from ralph_assets.models_search import find_ngram_candidates
+from ralph_assets.unknown_devices import get_unknown_device_query
+
+
+logger = logging.getLogger(__name__)
+
+QUOTATION_MARKS = re.compile(r"^\".+\"$")
+PREFIX_WILDCARD = '*'
+
+EXACT = 'exact'
+PREFIX = 'prefix'
+CONTAINS = 'contains'
+NGRAM = 'ngram'
+RANGE = 'range'
+CHOICE = 'choice'
+TREE = 'tree'
+FLAG = 'flag'
+
+
+def get_ngram_limit():
+    """Maximal number of candidates found in the n-gram index for which it's
+    used. Less selective searches fall back to plain substring matching."""
+    return getattr(settings, 'ASSETS_SEARCH_NGRAM_LIMIT', 10000)
+
+
+def get_prefix_fields():
+    """Text search parameters matched by prefix instead of substring. Prefix
+    lookups can use B-tree indexes, substring ones can't."""
+    return getattr(settings, 'ASSETS_SEARCH_PREFIX_FIELDS', ())
+
+
+def unquote(value):
+    """Strip the quotation marks around an exact value."""
+    if value and QUOTATION_MARKS.search(value):
+        return value[1:-1]
+    return value
+
+
+class SearchStep(object):
+    def __init__(self, name, strategy, query):
+        self.name = name
+        self.strategy = strategy
+        self.query = query
+
+    def __unicode__(self):
+        return '{}: {} {}'.format(self.name, self.strategy, self.query)
+
+
+class SearchPlan(object):
+    """The compiled query together with the steps it was built from and the
+    search parameters."""
+
+    def __init__(self, steps, params=None):
+        self.steps = steps
+        self.params = params or {}
+        self.query = Q()
+        for step in steps:
+            self.query &= step.query
+
+    def get_params(self):
+        """Return ``(name, value)`` pairs of the parameters applied to the
+        query, in the order of the registry. Parameters which are empty or
+        ignored aren't included, so equivalent searches have equal pairs."""
+        return [(step.name, self.params.get(step.name)) for step in self.steps]
+
+    def __unicode__(self):
+        return '; '.join(unicode(step) for step in self.steps) or 'all'
+
+
+class TextField(object):
+    """Quoted values are matched exactly, values ending with ``*`` by prefix
+    and other ones by substring, or by prefix if the parameter is listed in
+    ``ASSETS_SEARCH_PREFIX_FIELDS``.
+
+    With ``ngrams`` set, substring matching is limited to the candidates found
+    in the n-gram index (see :mod:`ralph_assets.models_search`).
+    """
+
+    def __init__(self, lookup, case_sensitive=False, ngrams=False):
+        self.lookup = lookup
+        self.case_sensitive = case_sensitive
+        self.ngrams = ngrams
+
+    def compile(self, name, params):
+        value = params.get(name)
+        if not value:
+            return []
+        if QUOTATION_MARKS.search(value):
+            return [SearchStep(name, EXACT, Q(**{self.lookup: value[1:-1]}))]
+        if value.endswith(PREFIX_WILDCARD) and len(value) > 1:
+            strategy, value = PREFIX, value[:-1]
+        elif name in get_prefix_fields():
+            strategy = PREFIX
+        else:
+            strategy = CONTAINS
+        suffix = {PREFIX: 'startswith', CONTAINS: 'contains'}[strategy]
+        if not self.case_sensitive:
+            suffix = 'i' + suffix
+        query = Q(**{'{}__{}'.format(self.lookup, suffix): value})
+        if strategy == CONTAINS and self.ngrams:
+            candidates = find_ngram_candidates(
+                self.lookup, value, get_ngram_limit(),
+            )
+            if candidates is not None:
+                strategy = NGRAM
+                query &= Q(pk__in=candidates)
+        return [SearchStep(name, strategy, query)]
+
+
+class EqualsField(object):
+    """The value (unquoted if needed) is matched exactly."""
+
+    def __init__(self, lookup=None):
+        self.lookup = lookup
+
+    def compile(self, name, params):
+        value = unquote(params.get(name))
+        if not value:
+            return []
+        return [SearchStep(name, EXACT, Q(**{self.lookup or name: value}))]
+
+
+class ChoiceField(object):
+    """Every accepted value maps to a query. Other values are ignored."""
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def compile(self, name, params):
+        query = self.queries.get(unquote(params.get(name)))
+        if query is None:
+            return []
+        return [SearchStep(name, CHOICE, query)]
+
+
+class FlagField(object):
+    """A checkbox, applied when it's on. The query may be a callable returning
+    it."""
+
+    def __init__(self, query):
+        self.query = query
+
+    def compile(self, name, params):
+        value = unquote(params.get(name))
+        if not value or value.lower() != 'on':
+            return []
+        query = self.query
+        if callable(query):
+            query = query()
+        return [SearchStep(name, FLAG, query)]
+
+
+class CategoryField(object):
+    """The category with all its subcategories."""
+
+    def compile(self, name, params):
+        query = get_category_query(unquote(params.get(name)))
+        if query is None:
+            return []
+        return [SearchStep(name, TREE, query)]
+
+
+class DateRangeField(object):
+    """``<name>_from`` and ``<name>_to`` parameters, both inclusive."""
+
+    def compile(self, name, params):
+        steps = []
+        start = params.get(name + '_from')
+        end = params.get(name + '_to')
+        if start:
+            steps.append(SearchStep(
+                name + '_from', RANGE, Q(**{name + '__gte': start}),
+            ))
+        if end:
+            steps.append(SearchStep(
+                name + '_to', RANGE, Q(**{name + '__lte': end}),
+            ))
+        return steps
+
+
+class DeprecatedAsOfField(object):
+    """Assets deprecated on a date given as YYYY-MM-DD."""
+
+    def compile(self, name, params):
+        value = params.get(name)
+        if not value:
+            return []
+        try:
+            date = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            return []
+        return [SearchStep(name, RANGE, get_deprecated_query(date))]
+
+
+def get_category_query(value):
+    """Return a ``Q`` object matching the category with id ``value`` and its
+    whole subtree, or None if ``value`` isn't a category id.
+
+    The subtree is the range of MPTT ``lft``/``rght`` values of the category,
+    read from the cached category tree.
+    """
+    try:
+        category_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    node = get_category_tree().get(category_id)
+    if node is None:
+        return Q(pk__in=[])
+    return Q(
+        category__tree_id=node.tree_id,
+        category__lft__gte=node.lft,
+        category__rght__lte=node.rght,
+    )
+
+
+def get_unlinked_query():
+    """Return a ``Q`` object matching assets with device info which aren't
+    linked to Ralph devices or are linked to devices of unknown type."""
+    return ~Q(device_info=None) & (
+        Q(device_info__ralph_device_id=None) | get_unknown_device_query()
+    )
+
+
+class SearchCompiler(object):
+    """Compiles search parameters with a registry of ``(name, field)``
+    pairs."""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def compile(self, params):
+        steps = []
+        for name, field in self.fields:
+            steps.extend(field.compile(name, params))
+        plan = SearchPlan(steps, params)
+        logger.debug('Asset search plan: %s', plan)
+        return plan
+
+
+ASSET_SEARCH_FIELDS = [
+    ('niw', TextField('niw', ngrams=True)),
+    ('category', CategoryField()),
+    ('invoice_no', TextField('invoice_no')),
+    ('model', TextField('model__name')),
+    ('order_no', TextField('order_no')),
+    ('part_info', ChoiceField({
+        'device': Q(part_info__isnull=True),
+        'part': Q(part_info__gte=0),
+    })),
+    ('provider', TextField('provider')),
+    ('sn', TextField('sn', ngrams=True)),
+    ('status', EqualsField()),
+    ('deleted', FlagField(Q(deleted__in=(True, False)))),
+    ('manufacturer', TextField('model__manufacturer__name')),
+    ('barcode', TextField('barcode', case_sensitive=True, ngrams=True)),
+    ('device_info', EqualsField()),
+    ('source', EqualsField()),
+    ('deprecation_rate', ChoiceField({
+        'null': Q(deprecation_rate__isnull=True),
+        'deprecated': Q(deprecation_rate=0),
+        '6': Q(deprecation_rate__gt=0, deprecation_rate__lte=6),
+        '12': Q(deprecation_rate__gt=6, deprecation_rate__lte=12),
+        '24': Q(deprecation_rate__gt=12, deprecation_rate__lte=24),
+        '48': Q(deprecation_rate__gt=24, deprecation_rate__lte=48),
+        '48>': Q(deprecation_rate__gt=48),
+    })),
+    ('unlinked', FlagField(get_unlinked_query)),
+    ('ralph_device_id', TextField('device_info__ralph_device_id')),
+    ('invoice_date', DateRangeField()),
+    ('request_date', DateRangeField()),
+    ('delivery_date', DateRangeField()),
+    ('production_use_date', DateRangeField()),
+    ('provider_order_date', DateRangeField()),
+    ('deprecated_as_of', DeprecatedAsOfField()),
+]
+
+asset_search = SearchCompiler(ASSET_SEARCH_FIELDS)
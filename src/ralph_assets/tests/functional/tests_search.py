@@ -559,3 +559,62 @@ class TestSearchProductionUseDateFields(TestCase):
 
         rows_from_table = content.context_data['bob_page'].object_list
         self.assertEqual(len(rows_from_table), 3)
+
+
+class TestSearchDeprecatedAsOf(TestCase):
+    def setUp(self):
+        self.client = login_as_su()
+        self.base_url = '/assets/dc/search'
+
+        self.first_asset = create_asset(
+            invoice_date=datetime.date(2012, 1, 31),
+            deprecation_rate=100,
+            sn='1234-1234-1234-1234',
+        )
+
+        self.second_asset = create_asset(
+            invoice_date=datetime.date(2012, 1, 31),
+            deprecation_rate=50,
+            sn='1235-1235-1235-1235',
+        )
+
+        self.third_asset = create_asset(
+            invoice_date=datetime.date(2013, 6, 1),
+            deprecation_rate=50,
+            force_deprecation=True,
+            sn='1236-1236-1236-1236',
+        )
+
+    def test_deprecated_as_of(self):
+        url = '?deprecated_as_of=%s' % '2013-02-01'
+        content = self.client.get(self.base_url + url)
+        self.assertEqual(content.status_code, 200)
+
+        rows_from_table = content.context_data['bob_page'].object_list
+        self.assertItemsEqual(
+            [asset.sn for asset in rows_from_table],
+            ['1234-1234-1234-1234', '1236-1236-1236-1236']
+        )
+
+    def test_deprecation_end_date_is_not_deprecated(self):
+        url = '?deprecated_as_of=%s' % '2013-01-31'
+        content = self.client.get(self.base_url + url)
+        self.assertEqual(content.status_code, 200)
+
+        rows_from_table = content.context_data['bob_page'].object_list
+        self.assertEqual(len(rows_from_table), 1)
+        self.assertEqual(rows_from_table[0].sn, '1236-1236-1236-1236')
+
+    def test_deprecated_bucket_is_zero_rate(self):
+        create_asset(
+            invoice_date=datetime.date(2013, 6, 1),
+            deprecation_rate=0,
+            sn='1237-1237-1237-1237',
+        )
+        url = '?deprecation_rate=deprecated'
+        content = self.client.get(self.base_url + url)
+        self.assertEqual(content.status_code, 200)
+
+        rows_from_table = content.context_data['bob_page'].object_list
+        self.assertEqual(len(rows_from_table), 1)
+        self.assertEqual(rows_from_table[0].sn, '1237-1237-1237-1237')
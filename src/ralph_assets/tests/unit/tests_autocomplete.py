@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import base64
+import cPickle
+import json
+
+from ajax_select.fields import AutoCompleteSelectField
+from ajax_select.views import ajax_lookup
+from django.core.cache import get_cache
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils.timezone import now
+
+from ralph_assets.autocomplete import (
+    PrefixIndex,
+    asset_index,
+    autocomplete_enabled,
+    find_devices,
+    find_names,
+    get_autocomplete_cache,
+    get_word_keys,
+    manufacturer_index,
+    model_index,
+    warehouse_index,
+)
+from ralph_assets.cache_util import bump_generation
+from ralph_assets.forms import LOOKUPS
+from ralph_assets.models_assets import AssetModel, AssetType
+from ralph_assets.tests.util import (
+    SHARED_CACHES,
+    create_asset,
+    create_model,
+    create_warehouse,
+)
+
+
+class TestPrefixIndex(TestCase):
+    def test_find(self):
+        index = PrefixIndex()
+        index.load([(1, get_word_keys('Dell R610')), (2, ['r710'])])
+        self.assertEqual(list(index.find('R')), [1, 2])
+        self.assertEqual(list(index.find('dell r6')), [1])
+        self.assertEqual(list(index.find('610')), [])
+        index.set(3, get_word_keys('Rack'))
+        index.remove(1)
+        self.assertEqual(list(index.find('r')), [2, 3])
+
+
+@override_settings(CACHES=SHARED_CACHES, ASSETS_AUTOCOMPLETE_CACHE='shared')
+class TestAutocomplete(TestCase):
+    def setUp(self):
+        get_autocomplete_cache().clear()
+        for index in (
+            manufacturer_index, model_index, warehouse_index, asset_index,
+        ):
+            index.reset = None
+        self.model = create_model(name='PowerEdge R610', manufacturer='Dell')
+        self.model2 = create_model(name='ProLiant DL360', manufacturer='HP')
+        create_warehouse()
+        self.asset = create_asset(sn='SN-100', barcode='bc-1')
+        self.asset2 = create_asset(sn='sn-200', model=self.model)
+        self.bo_asset = create_asset(
+            sn='sn-300', type=AssetType.back_office,
+        )
+
+    def find_models(self, prefix):
+        return [record.id for record in find_names(model_index, prefix)]
+
+    def find_devices(self, prefix, asset_types=(AssetType.data_center.id,)):
+        return [record.id for record in find_devices(prefix, asset_types)]
+
+    def lookup(self, channel, term):
+        """Return the results of the ajax lookup view."""
+        request = RequestFactory().get('/', {'term': term})
+        response = ajax_lookup(
+            request, base64.b64encode(cPickle.dumps(LOOKUPS[channel])),
+        )
+        return json.loads(response.content)
+
+    def test_find_names(self):
+        self.assertEqual(self.find_models('r6'), [self.model.pk])
+        self.assertEqual(
+            self.find_models('p'), [self.model.pk, self.model2.pk],
+        )
+        self.assertEqual(
+            [record.name for record in find_names(manufacturer_index, 'd')],
+            ['Dell'],
+        )
+
+    def test_find_devices(self):
+        self.assertEqual(
+            self.find_devices('sn-'), [self.asset.pk, self.asset2.pk],
+        )
+        self.assertEqual(self.find_devices('BC-'), [self.asset.pk])
+        self.assertEqual(self.find_devices('power'), [self.asset2.pk])
+        self.assertEqual(
+            self.find_devices('sn-', [AssetType.back_office.id]),
+            [self.bo_asset.pk],
+        )
+        self.assertEqual(
+            find_devices('sn-2', [AssetType.data_center.id])[0].model,
+            'Dell PowerEdge R610',
+        )
+
+    def test_lookups_select_objects(self):
+        # the picked object is sent back by its pk, which form fields load
+        for channel, term, obj in (
+            ('asset_model', 'r6', self.model),
+            ('asset_warehouse', 'ware', create_warehouse()),
+            ('asset_dcdevice', 'sn-2', self.asset2),
+        ):
+            results = self.lookup(channel, term)
+            self.assertEqual(len(results), 1)
+            field = AutoCompleteSelectField(LOOKUPS[channel])
+            self.assertEqual(field.clean(results[0]['pk']), obj)
+
+    def test_no_queries_when_up_to_date(self):
+        self.find_models('p')
+        self.find_devices('sn-')
+        find_names(warehouse_index, 'ware')
+        with self.assertNumQueries(0):
+            self.find_models('pro')
+            self.find_devices('sn-1')
+            find_names(warehouse_index, 'ware')
+            model_index.get_records()
+
+    def test_updated_on_save(self):
+        self.find_models('p')
+        self.model.name = 'Other R610'
+        self.model.save()
+        self.assertEqual(self.find_models('p'), [self.model2.pk])
+        self.assertEqual(self.find_models('other'), [self.model.pk])
+
+    def test_devices_updated_on_save(self):
+        self.find_devices('sn-')
+        self.asset.sn = 'other-100'
+        self.asset.save()
+        self.assertEqual(self.find_devices('sn-'), [self.asset2.pk])
+        self.assertEqual(self.find_devices('other'), [self.asset.pk])
+        self.asset.deleted = True
+        self.asset.save()
+        self.assertEqual(self.find_devices('other'), [])
+
+    def test_reloaded_on_delete(self):
+        self.find_models('p')
+        self.model2.delete()
+        self.assertEqual(self.find_models('p'), [self.model.pk])
+
+    @override_settings(ASSETS_AUTOCOMPLETE_MAX_ASSETS=2)
+    def test_too_many_assets(self):
+        self.assertIsNone(find_devices('sn-', [AssetType.data_center.id]))
+        self.assertEqual(asset_index.records, {})
+        results = self.lookup('asset_dcdevice', 'sn-2')
+        self.assertEqual(
+            [result['pk'] for result in results], [unicode(self.asset2.pk)],
+        )
+
+    def test_updated_by_other_process(self):
+        self.find_models('p')
+        AssetModel.objects.filter(pk=self.model.pk).update(
+            name='Other', modified=now(),
+        )
+        self.assertEqual(self.find_models('other'), [])
+        # another process saving a model bumps the generation through its own
+        # instance of the cache
+        bump_generation(get_cache('shared'), model_index.generation_key)
+        self.assertEqual(self.find_models('other'), [self.model.pk])
+
+    @override_settings(ASSETS_AUTOCOMPLETE_CACHE=(
+        'django.core.cache.backends.locmem.LocMemCache'
+    ))
+    def test_disabled_with_local_cache(self):
+        self.assertFalse(autocomplete_enabled())
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ralph_assets.counts import get_cached_count, get_count_cache
+from ralph_assets.models_assets import Asset
+from ralph_assets.tests.util import create_asset
+
+
+@override_settings(
+    ASSETS_COUNT_CACHE='django.core.cache.backends.locmem.LocMemCache',
+)
+class TestCachedCount(TestCase):
+    def setUp(self):
+        get_count_cache().clear()
+        self.asset = create_asset(sn='sn-1')
+        self.counted = 0
+
+    def count(self, key=('dc', False, 'all')):
+        def count():
+            self.counted += 1
+            return Asset.objects.count()
+        return get_cached_count(key, count)
+
+    def test_cached(self):
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(self.counted, 1)
+        self.assertEqual(self.count(('back_office', False, 'all')), 1)
+        self.assertEqual(self.counted, 2)
+
+    def test_invalidated_by_asset_changes(self):
+        self.count()
+        create_asset(sn='sn-2')
+        self.assertEqual(self.count(), 2)
+        self.asset.delete()
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(self.counted, 3)
+
+    def test_invalidated_by_info_changes(self):
+        self.count()
+        self.asset.device_info.save()
+        self.count()
+        self.assertEqual(self.counted, 2)
+
+    @override_settings(ASSETS_COUNT_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.count()
+        self.count()
+        self.assertEqual(self.counted, 2)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import random
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.test import TestCase
+
+from ralph_assets.deprecation import (
+    find_deprecation_drift,
+    get_computed_deprecated_query,
+    get_deprecated_query,
+    get_deprecation_statuses,
+    update_deprecation_end_dates,
+)
+from ralph_assets.models_assets import Asset
+from ralph_assets.tests.util import create_asset
+
+
+RATES = [
+    None, Decimal('0'), Decimal('1'), Decimal('3'), Decimal('7'),
+    Decimal('12.5'), Decimal('25'), Decimal('33.33'), Decimal('50'),
+    Decimal('100'), Decimal('150'),
+]
+
+
+def random_date(rng, start=datetime.date(2008, 1, 1), days=3000):
+    return start + datetime.timedelta(days=rng.randint(0, days))
+
+
+def get_baseline_months(deprecation_rate):
+    return int(
+        (1 / (deprecation_rate / 100) * 12)
+        if deprecation_rate else 0
+    )
+
+
+def get_baseline_end_date(invoice_date, deprecation_rate):
+    if not invoice_date:
+        return None
+    return invoice_date + relativedelta(
+        months=get_baseline_months(deprecation_rate),
+    )
+
+
+def is_baseline_deprecated(invoice_date, deprecation_rate, force_deprecation,
+                           date):
+    """Frozen copy of ``Asset.is_deprecated`` before the batch engine."""
+    if force_deprecation:
+        return True
+    if not invoice_date:
+        return False
+    return get_baseline_end_date(invoice_date, deprecation_rate) < date
+
+
+def random_row(rng):
+    return (
+        random_date(rng) if rng.random() > 0.1 else None,
+        rng.choice(RATES),
+        rng.random() < 0.1,
+    )
+
+
+class TestDeprecationStatuses(TestCase):
+    """Batch evaluation must agree with the per-object formula of
+    ``Asset.is_deprecated`` on random rows, including month ends and missing
+    invoice dates."""
+
+    def test_agrees_with_baseline(self):
+        rng = random.Random(1024)
+        for _ in xrange(50):
+            date = random_date(rng, days=5000)
+            rows = [random_row(rng) for _ in xrange(200)]
+            statuses = get_deprecation_statuses(rows, date)
+            for row, (is_deprecated, end_date) in zip(rows, statuses):
+                self.assertEqual(
+                    is_deprecated, is_baseline_deprecated(*row, date=date),
+                )
+                self.assertEqual(end_date, get_baseline_end_date(*row[:2]))
+
+    def test_asset_agrees_with_baseline(self):
+        rng = random.Random(512)
+        date = datetime.date(2013, 2, 28)
+        for _ in xrange(500):
+            row = random_row(rng)
+            asset = Asset(
+                invoice_date=row[0],
+                deprecation_rate=row[1],
+                force_deprecation=row[2],
+            )
+            self.assertEqual(
+                asset.is_deprecated(date),
+                is_baseline_deprecated(*row, date=date),
+            )
+            self.assertEqual(
+                asset.get_deprecation_months(), get_baseline_months(row[1]),
+            )
+
+    def test_queryset(self):
+        asset = create_asset(
+            sn='1111-1111-1111-1111',
+            invoice_date=datetime.date(2012, 11, 28),
+            deprecation_rate=100,
+        )
+        statuses = get_deprecation_statuses(
+            Asset.objects.filter(pk=asset.pk), datetime.date(2014, 3, 29),
+        )
+        self.assertEqual(statuses, [(True, datetime.date(2013, 11, 28))])
+
+
+class TestDeprecatedQuery(TestCase):
+    def setUp(self):
+        rng = random.Random(2048)
+        self.assets = []
+        for i in xrange(60):
+            invoice_date, rate, force = random_row(rng)
+            self.assets.append(create_asset(
+                sn='sn-{}'.format(i),
+                invoice_date=invoice_date,
+                deprecation_rate=rate,
+                force_deprecation=force,
+            ))
+        for day in (28, 29, 30, 31):
+            self.assets.append(create_asset(
+                sn='sn-month-end-{}'.format(day),
+                invoice_date=datetime.date(2012, 1, day),
+                deprecation_rate=Decimal('100'),
+            ))
+
+    def get_dates(self):
+        rng = random.Random(4096)
+        return [random_date(rng, days=5000) for _ in xrange(30)] + [
+            datetime.date(2013, 2, 27),
+            datetime.date(2013, 2, 28),
+            datetime.date(2013, 3, 1),
+        ]
+
+    def assert_query_agrees(self, get_query):
+        for date in self.get_dates():
+            found = set(Asset.objects.filter(
+                get_query(date),
+            ).values_list('id', flat=True))
+            expected = set(
+                asset.id for asset in self.assets
+                if is_baseline_deprecated(
+                    asset.invoice_date,
+                    asset.deprecation_rate,
+                    asset.force_deprecation,
+                    date,
+                )
+            )
+            self.assertEqual(found, expected)
+
+    def test_computed_agrees_with_baseline(self):
+        rates = Asset.objects.values_list(
+            'deprecation_rate', flat=True,
+        ).distinct()
+        self.assert_query_agrees(
+            lambda date: get_computed_deprecated_query(rates, date),
+        )
+
+    def test_stored_agrees_with_baseline(self):
+        self.assert_query_agrees(get_deprecated_query)
+
+
+class TestDeprecationDrift(TestCase):
+    def setUp(self):
+        self.asset = create_asset(
+            sn='1111-1111-1111-1111',
+            invoice_date=datetime.date(2012, 11, 28),
+            deprecation_rate=100,
+        )
+        self.asset2 = create_asset(
+            sn='1111-1111-1111-1112',
+            invoice_date=datetime.date(2012, 11, 28),
+            deprecation_rate=50,
+        )
+
+    def test_saved_assets_have_no_drift(self):
+        self.assertEqual(
+            self.asset.deprecation_end_date, datetime.date(2013, 11, 28),
+        )
+        self.assertEqual(list(find_deprecation_drift(Asset.objects.all())), [])
+
+    def test_drift_is_found_and_fixed(self):
+        Asset.objects.filter(pk=self.asset.pk).update(
+            deprecation_end_date=None,
+        )
+        Asset.objects.filter(pk=self.asset2.pk).update(deprecation_rate=100)
+        self.assertEqual(
+            sorted(find_deprecation_drift(Asset.objects.all(), chunk_size=1)),
+            [
+                (self.asset.pk, None, datetime.date(2013, 11, 28)),
+                (
+                    self.asset2.pk,
+                    datetime.date(2014, 11, 28),
+                    datetime.date(2013, 11, 28),
+                ),
+            ],
+        )
+        self.assertEqual(update_deprecation_end_dates(Asset.objects.all()), 2)
+        self.assertEqual(list(find_deprecation_drift(Asset.objects.all())), [])
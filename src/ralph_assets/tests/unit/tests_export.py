@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import os
+import pickle
+
+from bob.csvutil import make_csv_response as make_bob_csv_response
+from bob.data_table import DataTableMixin
+from django.test import TestCase
+
+from ralph.business.models import Venture
+from ralph.discovery.models_device import Device, DeviceType
+from ralph_assets.export import (
+    ExportPlan,
+    get_partitions,
+    iter_csv,
+    make_csv_file_response,
+    make_csv_response,
+    write_csv_file,
+    write_partitioned_csv_file,
+)
+from ralph_assets.models_assets import (
+    Asset,
+    AssetType,
+    DeviceInfo,
+    OfficeInfo,
+    PartInfo,
+)
+from ralph_assets.tests.util import create_asset
+from ralph_assets.views import BackOfficeSearch, DataCenterSearch
+
+
+ROWS = [
+    ['type', 'sn', 'remarks'],
+    ['device', '1111-1111-1111-1111', 'zażółć; "gęślą"'],
+    ['part', 1, None],
+]
+
+
+class TestStreamingExport(TestCase):
+    def test_same_output_as_bob(self):
+        expected = make_bob_csv_response(ROWS).content
+        self.assertEqual(b''.join(iter_csv(ROWS)), expected)
+        self.assertEqual(b''.join(make_csv_response(ROWS, 'a.csv')), expected)
+
+    def test_buffering(self):
+        rows = [['x' * 10]] * 100
+        pieces = list(iter_csv(rows, buffer_size=50))
+        self.assertTrue(len(pieces) > 1)
+        self.assertEqual(b''.join(pieces), b''.join(iter_csv(rows)))
+
+    def test_empty(self):
+        self.assertEqual(list(iter_csv([])), [])
+
+    def test_file(self):
+        path = write_csv_file(iter(ROWS))
+        response = make_csv_file_response(path, 'a.csv')
+        self.assertEqual(
+            response['Content-Disposition'], 'attachment; filename=a.csv',
+        )
+        self.assertEqual(b''.join(response), b''.join(iter_csv(ROWS)))
+        self.assertFalse(os.path.exists(path))
+
+
+def get_instance_row(asset, columns, type, model):
+    """Export row built from model instances, cell by cell."""
+    get_cell = DataTableMixin().get_cell
+    row = ['part', ] if asset.part_info else ['device', ]
+    for item in columns:
+        field = item.field
+        if field:
+            nested_field_name = item.foreign_field_name
+            if nested_field_name == type:
+                cell = get_cell(getattr(asset, type), field, model)
+            elif nested_field_name == 'part_info':
+                cell = get_cell(asset.part_info, field, PartInfo)
+            elif nested_field_name == 'venture':
+                cell = get_cell(asset.venture, field, Venture)
+            elif nested_field_name == 'is_discovered':
+                cell = unicode(asset.is_discovered)
+            else:
+                cell = get_cell(asset, field, Asset)
+            row.append(unicode(cell))
+    return row
+
+
+class TestExportPlan(TestCase):
+    def setUp(self):
+        venture = Venture(name='Venture1', symbol='venture1')
+        venture.save()
+        self.device = create_asset(
+            sn='1111-1111-1111-1111',
+            invoice_date=datetime.date(2012, 11, 28),
+            price=100,
+            deprecation_rate=25,
+            remarks='zażółć',
+        )
+        Device.objects.filter(
+            pk=self.device.device_info.ralph_device_id,
+        ).update(venture=venture)
+        dev = Device.create(
+            [('1', 'sda', 0)],
+            model_name='xxx',
+            model_type=DeviceType.rack_server,
+            allow_stub=1,
+        )
+        self.device2 = create_asset(sn='1111-1111-1111-1112')
+        self.device2.device_info.ralph_device_id = dev.id
+        self.device2.device_info.rack = '12'
+        self.device2.device_info.save()
+        part_info = PartInfo(device=self.device2, source_device=self.device)
+        part_info.save()
+        self.part = create_asset(
+            sn='1111-1111-1111-1113', part_info=part_info,
+        )
+        office_info = OfficeInfo(license_key='key', version='1.0')
+        office_info.save()
+        self.office = create_asset(
+            sn='1111-1111-1111-1114',
+            type=AssetType.back_office,
+            office_info=office_info,
+        )
+
+    def assert_plan(self, view_class, type, model, queryset=None):
+        if queryset is None:
+            queryset = Asset.objects.order_by('pk')
+        columns = view_class.columns + view_class.columns_nested
+        plan = ExportPlan(columns, type, model, DataTableMixin().get_cell)
+        rows = []
+        for chunk in plan.get_chunks(queryset, chunk_size=2):
+            rows.extend(chunk)
+        self.assertEqual(rows, [
+            get_instance_row(asset, columns, type, model)
+            for asset in queryset
+        ])
+
+    def test_data_center(self):
+        self.assert_plan(DataCenterSearch, 'device_info', DeviceInfo)
+
+    def test_back_office(self):
+        self.assert_plan(BackOfficeSearch, 'office_info', OfficeInfo)
+
+    def test_sorted(self):
+        # e.g. sorted by a column of the search table
+        self.assert_plan(
+            BackOfficeSearch, 'office_info', OfficeInfo,
+            Asset.objects.order_by('-sn'),
+        )
+
+    def test_query_count(self):
+        columns = DataCenterSearch.columns + DataCenterSearch.columns_nested
+        plan = ExportPlan(
+            columns, 'device_info', DeviceInfo, DataTableMixin().get_cell,
+        )
+        # assets, models, warehouses, parent assets, device infos and Ralph
+        # devices
+        with self.assertNumQueries(6):
+            list(plan.get_chunks(Asset.objects.all()))
+
+
+class FakeJob(object):
+    def __init__(self, result):
+        self.id = id(self)
+        self.result = result
+        self.meta = {}
+        self.is_finished = True
+        self.is_failed = False
+        self.is_cancelled = False
+
+    def refresh(self):
+        pass
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+class FakeQueue(object):
+    """Runs jobs synchronously, passing their arguments through pickle like
+    rq does."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def enqueue_call(self, func, args, timeout=None):
+        job = FakeJob(func(*pickle.loads(pickle.dumps(args))))
+        self.jobs.append(job)
+        return job
+
+
+class FailingQueue(FakeQueue):
+    """Runs the first job, fails the second one and leaves the others
+    queued."""
+
+    def enqueue_call(self, func, args, timeout=None):
+        if not self.jobs:
+            return super(FailingQueue, self).enqueue_call(func, args, timeout)
+        job = FakeJob(None)
+        job.is_finished = False
+        job.is_failed = len(self.jobs) == 1
+        self.jobs.append(job)
+        return job
+
+
+class TestPartitionedExport(TestCase):
+    def setUp(self):
+        for i in xrange(7):
+            create_asset(
+                sn='2222-2222-2222-{}'.format(i),
+                remarks='zażółć',
+                deprecation_rate=i,
+            )
+        self.columns = (
+            DataCenterSearch.columns + DataCenterSearch.columns_nested
+        )
+        self.header = ['type'] + [
+            column.header_name for column in self.columns if column.export
+        ]
+
+    def test_partitions(self):
+        pks = list(Asset.objects.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(get_partitions(Asset.objects.all(), 3), [
+            (None, pks[3], 3),
+            (pks[3], pks[6], 3),
+            (pks[6], None, 1),
+        ])
+        self.assertEqual(
+            get_partitions(Asset.objects.all(), 10),
+            [(None, pks[1], 1)] + [
+                (pks[i], pks[i + 1], 1) for i in xrange(1, 6)
+            ] + [(pks[6], None, 1)],
+        )
+        self.assertEqual(
+            get_partitions(Asset.objects.none(), 3), [(None, None, 0)],
+        )
+
+    def test_same_as_serial(self):
+        queryset = Asset.objects.filter(deprecation_rate__gt=0)
+        queue = FakeQueue()
+        path = write_partitioned_csv_file(
+            queryset, self.header, self.columns, 'device_info', DeviceInfo,
+            3, queue=queue,
+        )
+        self.assertEqual(len(queue.jobs), 3)
+        plan = ExportPlan(self.columns, 'device_info', DeviceInfo)
+        rows = [self.header]
+        for chunk in plan.get_chunks(queryset):
+            rows.extend(chunk)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b''.join(iter_csv(rows)))
+        os.remove(path)
+        for job in queue.jobs:
+            self.assertFalse(os.path.exists(job.result))
+
+    def test_failed_partition(self):
+        queue = FailingQueue()
+        with self.assertRaises(RuntimeError):
+            write_partitioned_csv_file(
+                Asset.objects.all(), self.header, self.columns,
+                'device_info', DeviceInfo, 3, queue=queue,
+            )
+        finished, failed, queued = queue.jobs
+        self.assertFalse(os.path.exists(finished.result))
+        self.assertFalse(os.path.exists(os.path.dirname(finished.result)))
+        self.assertFalse(failed.is_cancelled)
+        self.assertTrue(queued.is_cancelled)
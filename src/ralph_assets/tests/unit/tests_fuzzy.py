@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ralph_assets.fuzzy import (
+    find_candidates,
+    fuzzy_search,
+    get_distance,
+    get_unlinked_assets,
+)
+from ralph_assets.tests.util import create_asset, create_model
+
+
+def full_scan(query, limit=10):
+    """Ids of assets ranked like the lookup did before the shortlist: every
+    unlinked asset scored."""
+    assets = get_unlinked_assets().select_related('model').order_by('pk')
+    ranked = sorted(assets, key=lambda asset: get_distance(
+        query, asset.sn, asset.barcode, asset.model.name,
+    ))
+    return [asset.pk for asset in ranked[:limit]]
+
+
+@override_settings(ASSETS_SEARCH_NGRAMS=True)
+class TestFuzzySearch(TestCase):
+    def setUp(self):
+        self.assets = [
+            create_asset(sn='abc-{:04d}'.format(i)) for i in xrange(12)
+        ]
+        model = create_model(name='PowerEdge R610', manufacturer='Dell')
+        self.poweredge = [
+            create_asset(sn='xyz-{}'.format(i), model=model) for i in xrange(2)
+        ]
+
+    def search(self, query, limit=10):
+        return [
+            asset.pk for asset in fuzzy_search(
+                get_unlinked_assets(), query, limit,
+            )
+        ]
+
+    def get_candidates(self, query, limit):
+        return find_candidates(get_unlinked_assets(), query, limit)
+
+    def test_short_query(self):
+        self.assertIsNone(self.get_candidates('c-', 300))
+        self.assertEqual(self.search('c-'), full_scan('c-'))
+        self.assertEqual(self.search('xy'), full_scan('xy'))
+
+    @override_settings(ASSETS_FUZZY_CANDIDATES=3)
+    def test_model_name_only(self):
+        poweredge = [asset.pk for asset in self.poweredge]
+        self.assertEqual(
+            set(self.get_candidates('poweredg', 3)), set(poweredge),
+        )
+        self.assertEqual(full_scan('poweredg', limit=2), poweredge)
+        self.assertEqual(self.search('poweredg', limit=2), poweredge)
+
+    @override_settings(ASSETS_FUZZY_CANDIDATES=5)
+    def test_ties(self):
+        # all the abc assets are equally similar to the query, the first ones
+        # win in both rankings
+        expected = full_scan('abc-00', limit=3)
+        self.assertEqual(expected, [asset.pk for asset in self.assets[:3]])
+        self.assertEqual(self.search('abc-00', limit=3), expected)
+
+    def test_filled_up(self):
+        for query in ('0011', 'zzz-1'):
+            self.assertLess(
+                len(self.get_candidates(query, 300)), len(self.assets),
+            )
+            self.assertEqual(self.search(query), full_scan(query))
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ralph_assets.choice_labels import get_choice_label
+from ralph_assets.history import (
+    buffered_history,
+    display_resolver,
+    save_changes,
+)
+from ralph_assets.history_archive import HistoryTimeline, archive_history
+from ralph_assets.models_assets import (
+    Asset,
+    DeviceInfo,
+    OfficeInfo,
+    Warehouse,
+)
+from ralph_assets.models_history import (
+    ArchivedAssetHistoryChange,
+    AssetHistoryChange,
+)
+from ralph_assets.tests.util import create_asset, create_warehouse
+
+
+class TestBufferedHistory(TestCase):
+    def setUp(self):
+        self.assets = [create_asset(sn='sn-{}'.format(i)) for i in xrange(3)]
+
+    def get_changes(self):
+        return list(AssetHistoryChange.objects.filter(
+            field_name__in=('remarks', 'niw'),
+        ).order_by('asset', 'field_name').values_list(
+            'asset', 'field_name', 'old_value', 'new_value',
+        ))
+
+    def edit(self):
+        for asset in self.assets:
+            asset.remarks = 'edited'
+            asset.niw = 'niw'
+            asset.save()
+
+    def test_same_rows(self):
+        self.edit()
+        unbuffered = self.get_changes()
+        AssetHistoryChange.objects.all().delete()
+        for asset in self.assets:
+            asset.remarks = ''
+            asset.niw = None
+            asset.save()
+        AssetHistoryChange.objects.all().delete()
+        with buffered_history():
+            self.edit()
+            self.assertEqual(self.get_changes(), [])
+        self.assertEqual(self.get_changes(), unbuffered)
+        self.assertEqual(len(unbuffered), 6)
+
+    def test_nested(self):
+        with buffered_history():
+            with buffered_history():
+                self.edit()
+            self.assertEqual(self.get_changes(), [])
+        self.assertEqual(len(self.get_changes()), 6)
+
+    def test_discarded_on_error(self):
+        try:
+            with buffered_history():
+                self.edit()
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.get_changes(), [])
+
+    def test_decorator(self):
+        buffered_history()(self.edit)()
+        self.assertEqual(len(self.get_changes()), 6)
+
+
+class TestDisplayResolver(TestCase):
+    def setUp(self):
+        display_resolver.clear()
+        self.asset = create_asset(sn='sn-1')
+        self.warehouse = create_warehouse('Other')
+
+    def test_cached(self):
+        warehouse = self.asset.warehouse
+        self.assertEqual(
+            display_resolver.resolve(Warehouse, [warehouse.pk, 0]),
+            {warehouse.pk: unicode(warehouse)},
+        )
+        with self.assertNumQueries(0):
+            display_resolver.resolve(Warehouse, [warehouse.pk])
+        warehouse.name = 'Renamed'
+        warehouse.save()
+        self.assertEqual(
+            display_resolver.resolve(Warehouse, [warehouse.pk]),
+            {warehouse.pk: 'Renamed'},
+        )
+
+    def test_field_changes(self):
+        old_warehouse = unicode(self.asset.warehouse)
+        self.asset.warehouse = self.warehouse
+        self.asset.save()
+        self.assertEqual(
+            list(AssetHistoryChange.objects.filter(
+                field_name='warehouse',
+            ).values_list('old_value', 'new_value')),
+            [(old_warehouse, unicode(self.warehouse))],
+        )
+
+
+class TestChoiceLabels(TestCase):
+    def test_same_as_field_choices(self):
+        for model, field_name in (
+            (Asset, 'status'),
+            (Asset, 'type'),
+            (OfficeInfo, 'license_type'),
+        ):
+            field = model._meta.get_field_by_name(field_name)[0]
+            for value, label in field.get_choices(include_blank=False):
+                self.assertEqual(
+                    get_choice_label(model, field_name, value), label,
+                )
+        self.assertIsNone(get_choice_label(Asset, 'status', 12345))
+
+
+class TestOwnerAsset(TestCase):
+    def get_owners(self, **kwargs):
+        return set(AssetHistoryChange.objects.filter(**kwargs).values_list(
+            'owner_asset', flat=True,
+        ))
+
+    def create_with_device_info(self):
+        device_info = DeviceInfo(u_level='1')
+        device_info.save()
+        device_info.u_level = '2'
+        device_info.save()
+        return create_asset(sn='sn-1', device_info=device_info)
+
+    def test_info_saved_before_asset(self):
+        asset = self.create_with_device_info()
+        self.assertEqual(
+            self.get_owners(device_info=asset.device_info), {asset.id},
+        )
+
+    def test_info_saved_before_asset_buffered(self):
+        with buffered_history():
+            asset = self.create_with_device_info()
+        self.assertEqual(
+            self.get_owners(device_info=asset.device_info), {asset.id},
+        )
+
+    def test_info_saved_after_asset(self):
+        asset = create_asset(sn='sn-1')
+        asset.device_info.u_level = '3'
+        asset.device_info.save()
+        self.assertEqual(
+            self.get_owners(device_info=asset.device_info), {asset.id},
+        )
+        self.assertEqual(self.get_owners(asset=asset), {asset.id})
+
+
+@override_settings(
+    ASSETS_COUNT_CACHE='django.core.cache.backends.locmem.LocMemCache',
+)
+class TestHistoryArchive(TestCase):
+    def setUp(self):
+        self.asset = create_asset(sn='sn-1')
+        for i in xrange(5):
+            self.asset.remarks = 'remarks {}'.format(i)
+            self.asset.save()
+        changes = AssetHistoryChange.objects.filter(owner_asset=self.asset)
+        for i, change in enumerate(changes.order_by('id')):
+            change.date = datetime.datetime(2010, 1, 1 + i)
+            change.save()
+        self.total = changes.count()
+        self.now = datetime.datetime(2010, 1, 4)
+
+    def get_values(self, changes):
+        return [(change.id, change.new_value) for change in changes]
+
+    def test_archive(self):
+        expected = self.get_values(HistoryTimeline(self.asset.id)[0:None])
+        self.assertEqual(archive_history(self.now, batch_size=1), 3)
+        self.assertEqual(
+            AssetHistoryChange.objects.filter(
+                owner_asset=self.asset,
+            ).count(),
+            self.total - 3,
+        )
+        self.assertEqual(
+            ArchivedAssetHistoryChange.objects.filter(
+                owner_asset_id=self.asset.id,
+            ).count(),
+            3,
+        )
+        timeline = HistoryTimeline(self.asset.id)
+        self.assertEqual(timeline.count(), self.total)
+        self.assertEqual(self.get_values(timeline[0:None]), expected)
+        self.assertEqual(self.get_values(timeline[1:4]), expected[1:4])
+
+    def test_archive_not_read_for_recent_pages(self):
+        archive_history(self.now)
+        timeline = HistoryTimeline(self.asset.id)
+        timeline.get_hot_count()
+        with self.assertNumQueries(1):
+            timeline[0:1]
+
+    def test_status(self):
+        archive_history(self.now)
+        self.assertEqual(
+            [change.field_name for change in HistoryTimeline(
+                self.asset.id, field_name='status',
+            )[0:None]],
+            ['status'],
+        )
+
+    def test_more_parameters_than_sqlite_allows(self):
+        # the changes of a batch have many more than 999 values together
+        save_changes([
+            AssetHistoryChange(
+                date=datetime.datetime(2009, 1, 1),
+                asset=self.asset,
+                owner_asset=self.asset,
+                field_name='remarks',
+                new_value='old remarks {}'.format(i),
+            ) for i in xrange(120)
+        ])
+        self.assertEqual(archive_history(self.now), 123)
+        self.assertEqual(
+            ArchivedAssetHistoryChange.objects.filter(
+                owner_asset_id=self.asset.id,
+            ).count(),
+            123,
+        )
+        self.assertFalse(
+            AssetHistoryChange.objects.filter(date__lt=self.now).exists(),
+        )
+
+    def test_owner_set_when_archived(self):
+        AssetHistoryChange.objects.create(
+            date=datetime.datetime(2009, 1, 1),
+            device_info=self.asset.device_info,
+            field_name='u_level',
+            new_value='orphan',
+        )
+        archive_history(self.now)
+        self.assertEqual(
+            ArchivedAssetHistoryChange.objects.get(
+                new_value='orphan',
+            ).owner_asset_id,
+            self.asset.id,
+        )
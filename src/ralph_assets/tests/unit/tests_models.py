@@ -9,10 +9,17 @@ import datetime
 import mock
 from django.test import TestCase
 
+from ralph.business.models import Venture
 from ralph.discovery.models_device import Device, DeviceType
 
 from ralph_assets.api_pricing import get_assets, get_asset_parts
-from ralph_assets.models_assets import PartInfo, AssetModel
+from ralph_assets.models_assets import (
+    Asset,
+    AssetModel,
+    PartInfo,
+    prefetch_discovered,
+    prefetch_ventures,
+)
 from ralph_assets.tests.util import create_asset
 
 
@@ -63,6 +70,38 @@ class TestModelAsset(TestCase):
         self.assertEqual(self.asset2.is_discovered, False)
         self.assertEqual(self.asset3.is_discovered, False)
 
+    def test_prefetch_ventures(self):
+        venture = Venture(name='Venture1', symbol='venture1')
+        venture.save()
+        Device.objects.filter(pk=666).update(venture=venture)
+        assets = Asset.objects.select_related('device_info').filter(
+            pk__in=[self.asset.pk, self.asset2.pk, self.asset3.pk],
+        ).order_by('pk')
+        with self.assertNumQueries(2):
+            assets = prefetch_ventures(assets)
+            ventures = [asset.venture for asset in assets]
+        self.assertEqual(ventures[0], venture)
+        self.assertEqual(ventures[0], self.asset.venture)
+        self.assertEqual(ventures[1], self.asset2.venture)
+        self.assertEqual(ventures[2], self.asset3.venture)
+
+    def test_prefetch_discovered(self):
+        part_info = PartInfo(device=self.asset)
+        part_info.save()
+        part = create_asset(sn='1111-1111-1111-1114', part_info=part_info)
+        pks = [self.asset.pk, self.asset2.pk, self.asset3.pk, part.pk]
+        assets = prefetch_discovered(
+            Asset.objects.filter(pk__in=pks).order_by('pk'),
+        )
+        self.assertEqual(
+            [asset.is_discovered for asset in assets],
+            [True, False, False, True],
+        )
+        self.assertEqual(
+            [asset.is_discovered for asset in assets],
+            [Asset.objects.get(pk=pk).is_discovered for pk in pks],
+        )
+
     def test_is_deperecation(self):
         date = datetime.date(2014, 03, 29)
         self.assertEqual(self.asset.get_deprecation_months(), 12)
@@ -110,6 +149,20 @@ class TestApiAssets(TestCase):
             self.assertEqual(item['sn'], self.asset.sn)
             self.assertEqual(item['barcode'], self.asset.barcode)
 
+    def tests_api_asset_query_count(self):
+        date = datetime.date(2014, 03, 29)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(get_assets(date))), 1)
+        for i in xrange(10):
+            create_asset(
+                sn='2222-2222-2222-{}'.format(i),
+                invoice_date=datetime.date(2012, 11, 28),
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(get_assets(date))), 11)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(list(get_assets(date, chunk_size=5))), 11)
+
     def tests_api_asset_part(self):
         for item in get_asset_parts():
             self.assertEqual(item['price'], 100)
@@ -119,3 +172,42 @@ class TestApiAssets(TestCase):
             self.assertEqual(item['asset_id'], self.asset2.id)
             self.assertEqual(item['sn'], self.asset.sn)
             self.assertEqual(item['barcode'], self.asset.barcode)
+
+    def tests_api_asset_part_query_count(self):
+        for i in xrange(5):
+            part_info = PartInfo(device=self.asset)
+            part_info.save()
+            create_asset(
+                sn='2222-2222-2222-{}'.format(i),
+                part_info=part_info,
+            )
+        with self.assertNumQueries(1):
+            parts = list(get_asset_parts())
+        self.assertEqual(len(parts), 6)
+        self.assertEqual(
+            set(item['ralph_id'] for item in parts),
+            {self.asset.device_info.ralph_device_id},
+        )
+
+
+class TestDiscoveredQueryCount(TestCase):
+    """Query count of the "Discovered" column: per row before, constant
+    for the whole batch after ``prefetch_discovered``."""
+
+    def setUp(self):
+        for i in xrange(20):
+            create_asset(sn='3333-3333-3333-{}'.format(i))
+
+    def test_per_row(self):
+        assets = list(Asset.objects.all())
+        with self.assertNumQueries(3 * len(assets)):
+            for asset in assets:
+                asset.is_discovered
+
+    def test_batched(self):
+        for size in (5, 20):
+            assets = list(Asset.objects.all()[:size])
+            with self.assertNumQueries(2):
+                prefetch_discovered(assets)
+                for asset in assets:
+                    asset.is_discovered
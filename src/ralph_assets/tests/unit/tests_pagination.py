@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from ralph_assets.models_assets import Asset
+from ralph_assets.pagination import (
+    KeysetPaginator,
+    decode_cursor,
+    encode_cursor,
+    get_keyset_key,
+)
+from ralph_assets.tests.util import create_asset, create_model
+
+
+class TestKeysetPaginator(TestCase):
+    def setUp(self):
+        other_model = create_model(name='Model2')
+        for i in xrange(7):
+            create_asset(
+                sn='sn-{}'.format(i),
+                barcode='bc-{}'.format(7 - i) if i % 3 else None,
+                price='{}.50'.format(i % 4),
+                model=other_model if i % 2 else None,
+            )
+
+    def walk(self, paginator):
+        """Return ids of all pages walked forwards and then backwards."""
+        forwards = []
+        page = paginator.page()
+        self.assertFalse(page.has_previous)
+        forwards.append([asset.pk for asset in page])
+        while page.has_next:
+            page = paginator.page(after=page.last_cursor)
+            forwards.append([asset.pk for asset in page])
+        backwards = [[asset.pk for asset in page]]
+        while page.has_previous:
+            page = paginator.page(before=page.first_cursor)
+            backwards.insert(0, [asset.pk for asset in page])
+        return forwards, backwards
+
+    def assert_walks(self, key, descending=False):
+        sign = '-' if descending else ''
+        ordering = [sign + key, sign + 'pk'] if key else [sign + 'pk']
+        ids = list(
+            Asset.objects.order_by(*ordering).values_list('pk', flat=True)
+        )
+        expected = [ids[i:i + 2] for i in xrange(0, len(ids), 2)]
+        forwards, backwards = self.walk(KeysetPaginator(
+            Asset.objects.all(), 2, key=key, descending=descending,
+        ))
+        self.assertEqual(forwards, expected)
+        self.assertEqual(backwards, expected)
+
+    def test_pk(self):
+        self.assert_walks(None)
+        self.assert_walks(None, descending=True)
+
+    def test_nullable_key(self):
+        self.assert_walks('barcode')
+        self.assert_walks('barcode', descending=True)
+
+    def test_key_with_ties(self):
+        self.assert_walks('price')
+        self.assert_walks('model', descending=True)
+
+    def test_count(self):
+        self.assertEqual(KeysetPaginator(Asset.objects.all(), 2).count, 7)
+        paginator = KeysetPaginator(Asset.objects.all(), 2, count_limit=5)
+        self.assertEqual(paginator.count, 6)
+        self.assertFalse(paginator.count_exact)
+
+    def test_malformed_cursor(self):
+        paginator = KeysetPaginator(Asset.objects.all(), 2)
+        self.assertEqual(
+            [asset.pk for asset in paginator.page(after='foo')],
+            [asset.pk for asset in paginator.page()],
+        )
+        self.assertIsNone(decode_cursor(encode_cursor(['a', 'b'])))
+        self.assertEqual(decode_cursor(encode_cursor(['a', 1])), ['a', 1])
+
+    def test_get_keyset_key(self):
+        self.assertEqual(get_keyset_key(Asset, 'sn'), 'sn')
+        self.assertEqual(get_keyset_key(Asset, 'model'), 'model')
+        self.assertEqual(
+            get_keyset_key(Asset, 'model__name'), 'model__name',
+        )
+        self.assertIsNone(get_keyset_key(Asset, 'venture'))
+        self.assertIsNone(get_keyset_key(Asset, 'sn__name'))
+        self.assertIsNone(get_keyset_key(Asset, ''))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from ralph_assets.progress import ProgressReporter
+
+
+class FakeJob(object):
+    """Stands for an rq job, counting writes to Redis."""
+
+    def __init__(self):
+        self.meta = {'progress': 0, 'start_progress': None}
+        self.saves = []
+
+    def save(self):
+        self.saves.append(self.meta['progress'])
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressReporter(TestCase):
+    def setUp(self):
+        self.job = FakeJob()
+        self.clock = FakeClock()
+
+    def test_step(self):
+        progress = ProgressReporter(
+            50000, job=self.job, interval=60, step=0.1, clock=self.clock,
+        )
+        for _ in xrange(50000):
+            progress.advance()
+        progress.finish()
+        self.assertEqual(len(self.job.saves), 11)
+        self.assertEqual(self.job.saves[0], 1 / 50000)
+        self.assertEqual(self.job.saves[-1], 1)
+
+    def test_interval(self):
+        progress = ProgressReporter(
+            1000, job=self.job, interval=2, step=1, clock=self.clock,
+        )
+        for i in xrange(1000):
+            self.clock.now = i / 100
+            progress.advance()
+        self.assertEqual(len(self.job.saves), 5)
+        progress.finish()
+        self.assertEqual(self.job.saves[-1], 1)
+
+    def test_no_job(self):
+        progress = ProgressReporter(10, interval=0, step=0)
+        progress.advance(10)
+        progress.finish()
+        self.assertEqual(progress.progress, 1)
+
+    def test_empty(self):
+        progress = ProgressReporter(0, job=self.job)
+        progress.finish()
+        self.assertEqual(self.job.saves, [1])
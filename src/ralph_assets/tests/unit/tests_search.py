@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.core.cache import get_cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from ralph.discovery.models_device import Device, DeviceType
+
+from ralph_assets.cache_util import bump_generation
+from ralph_assets.categories import (
+    GENERATION_KEY,
+    get_category_cache,
+    get_category_tree,
+)
+from ralph_assets.forms import AddDeviceForm, SearchAssetForm
+from ralph_assets.models_assets import Asset, AssetCategory
+from ralph_assets.models_search import (
+    AssetNgram,
+    AssetSearchDocument,
+    AssetSearchToken,
+    find_ngram_candidates,
+    get_ngrams,
+    get_search_tokens,
+    quick_search,
+    rebuild_ngrams,
+    rebuild_search_documents,
+)
+from ralph_assets.search import (
+    CHOICE,
+    CONTAINS,
+    EXACT,
+    FLAG,
+    NGRAM,
+    PREFIX,
+    RANGE,
+    asset_search,
+)
+from ralph_assets.unknown_devices import find_unknown_device_ids
+from ralph_assets.tests.util import (
+    SHARED_CACHES,
+    create_asset,
+    create_category,
+)
+
+
+def create_server():
+    return Device.create(
+        [('1', 'sda', 0)],
+        model_name='xxx',
+        model_type=DeviceType.rack_server,
+        allow_stub=1,
+    )
+
+
+class TestSearchCompiler(TestCase):
+    def setUp(self):
+        for sn in ('abc-123', 'ABC-1234', 'xabc-1'):
+            create_asset(sn=sn, barcode='bc-' + sn)
+
+    def search(self, **params):
+        plan = asset_search.compile(params)
+        return plan, set(
+            Asset.objects.filter(plan.query).values_list('sn', flat=True)
+        )
+
+    def get_strategies(self, plan):
+        return [(step.name, step.strategy) for step in plan.steps]
+
+    def test_empty(self):
+        plan, found = self.search()
+        self.assertEqual(plan.steps, [])
+        self.assertEqual(len(found), 3)
+
+    def test_contains(self):
+        plan, found = self.search(sn='abc-1')
+        self.assertEqual(self.get_strategies(plan), [('sn', NGRAM)])
+        self.assertEqual(found, {'abc-123', 'ABC-1234', 'xabc-1'})
+
+    def test_contains_subquery(self):
+        with self.assertNumQueries(1):
+            plan = asset_search.compile({'sn': 'abc-1'})
+        with self.assertNumQueries(1):
+            self.assertEqual(Asset.objects.filter(plan.query).count(), 3)
+
+    @override_settings(ASSETS_SEARCH_NGRAMS=False)
+    def test_contains_without_ngrams(self):
+        plan, found = self.search(sn='abc-1')
+        self.assertEqual(self.get_strategies(plan), [('sn', CONTAINS)])
+        self.assertEqual(found, {'abc-123', 'ABC-1234', 'xabc-1'})
+
+    @override_settings(ASSETS_SEARCH_NGRAM_LIMIT=2)
+    def test_contains_not_selective(self):
+        plan, found = self.search(sn='abc')
+        self.assertEqual(self.get_strategies(plan), [('sn', CONTAINS)])
+        self.assertEqual(found, {'abc-123', 'ABC-1234', 'xabc-1'})
+
+    def test_exact(self):
+        plan, found = self.search(sn='"abc-123"')
+        self.assertEqual(self.get_strategies(plan), [('sn', EXACT)])
+        self.assertEqual(found, {'abc-123'})
+
+    def test_prefix_wildcard(self):
+        plan, found = self.search(sn='abc-1*')
+        self.assertEqual(self.get_strategies(plan), [('sn', PREFIX)])
+        self.assertEqual(found, {'abc-123', 'ABC-1234'})
+
+    def test_case_sensitive_prefix(self):
+        plan, found = self.search(barcode='bc-abc*')
+        self.assertIn('barcode__startswith', unicode(plan))
+
+    @override_settings(ASSETS_SEARCH_PREFIX_FIELDS=('sn',))
+    def test_prefix_fields(self):
+        plan, found = self.search(sn='abc-1', barcode='bc-')
+        self.assertEqual(
+            self.get_strategies(plan), [('sn', PREFIX), ('barcode', NGRAM)],
+        )
+        self.assertEqual(found, {'abc-123', 'ABC-1234'})
+
+    def test_other_fields(self):
+        plan, found = self.search(
+            deprecation_rate='null',
+            invoice_date_from='2010-01-01',
+            deprecated_as_of='2013-13-13',
+            part_info='unknown',
+        )
+        self.assertEqual(self.get_strategies(plan), [
+            ('deprecation_rate', CHOICE),
+            ('invoice_date_from', RANGE),
+        ])
+
+    def test_params(self):
+        plan = asset_search.compile({
+            'barcode': '',
+            'part_info': 'unknown',
+            'sn': 'abc-1',
+            'unlinked': 'on',
+            'invoice_date_to': '2010-01-01',
+        })
+        # the n-gram and unlinked subqueries aren't run
+        with self.assertNumQueries(0):
+            self.assertEqual(plan.get_params(), [
+                ('sn', 'abc-1'),
+                ('unlinked', 'on'),
+                ('invoice_date_to', '2010-01-01'),
+            ])
+
+    def test_quoted_choices(self):
+        plan, found = self.search(
+            part_info='"device"', deleted='"on"', deprecation_rate='"null"',
+        )
+        self.assertEqual(self.get_strategies(plan), [
+            ('part_info', CHOICE),
+            ('deleted', FLAG),
+            ('deprecation_rate', CHOICE),
+        ])
+
+
+class TestNgrams(TestCase):
+    def setUp(self):
+        self.asset = create_asset(sn='SN-12345', barcode='BC-99')
+        self.asset2 = create_asset(sn='sn-1234x', barcode='bc-98')
+
+    def test_get_ngrams(self):
+        self.assertEqual(get_ngrams('AbCd'), {'abc', 'bcd'})
+        self.assertEqual(get_ngrams('ab'), set())
+        self.assertEqual(get_ngrams(None), set())
+
+    def find(self, field_name, value, limit=10):
+        candidates = find_ngram_candidates(field_name, value, limit)
+        return None if candidates is None else list(candidates)
+
+    def test_candidates(self):
+        self.assertEqual(
+            set(self.find('sn', 'n-1234')),
+            {self.asset.pk, self.asset2.pk},
+        )
+        self.assertEqual(
+            self.find('sn', '2345'), [self.asset.pk],
+        )
+        self.assertEqual(self.find('barcode', '2345'), [])
+        self.assertEqual(
+            set(self.find('sn', 'sn-', 2)), {self.asset.pk, self.asset2.pk},
+        )
+        self.assertIsNone(find_ngram_candidates('sn', 'sn-', 1))
+        self.assertIsNone(self.find('sn', 'sn'))
+
+    def test_long_value(self):
+        self.asset.sn = 'abcdefghijklmnopqrstuvwxyz'
+        self.asset.save()
+        self.assertEqual(
+            self.find('sn', 'bcdefghijklmnopqrstuvwxy'),
+            [self.asset.pk],
+        )
+
+    def test_updated_on_save(self):
+        self.asset.sn = 'other'
+        self.asset.save()
+        self.assertEqual(self.find('sn', '2345'), [])
+        self.assertEqual(
+            self.find('sn', 'other'), [self.asset.pk],
+        )
+
+    def test_rebuild(self):
+        AssetNgram.objects.all().delete()
+        Asset.objects.filter(pk=self.asset.pk).update(niw='niw-1')
+        self.assertEqual(rebuild_ngrams(Asset.objects.all(), chunk_size=1), 2)
+        self.assertEqual(
+            self.find('niw', 'niw'), [self.asset.pk],
+        )
+        self.assertEqual(
+            set(self.find('sn', 'n-1234')),
+            {self.asset.pk, self.asset2.pk},
+        )
+
+
+class TestQuickSearch(TestCase):
+    def setUp(self):
+        self.asset = create_asset(
+            sn='SN-100', barcode='bc-1', remarks='old Dell server',
+        )
+        self.asset2 = create_asset(
+            sn='dell-200', barcode='bc-2', remarks='spare',
+        )
+
+    def search(self, query):
+        return [
+            (row['asset'], row['score'])
+            for row in quick_search(query, Asset.objects.all())
+        ]
+
+    def test_get_search_tokens(self):
+        self.assertEqual(
+            get_search_tokens('Dell-200 R2'),
+            {'dell-200', 'dell', '200', 'r2'},
+        )
+
+    def test_ranking(self):
+        self.assertEqual(
+            self.search('dell'), [(self.asset2.pk, 20), (self.asset.pk, 1)],
+        )
+        self.assertEqual(
+            self.search('model1'), [(self.asset.pk, 5), (self.asset2.pk, 5)],
+        )
+
+    def test_all_words(self):
+        self.assertEqual(self.search('DELL spa'), [(self.asset2.pk, 21)])
+        self.assertEqual(self.search('dell other'), [])
+        self.assertEqual(self.search(' '), [])
+
+    def test_updated_on_save(self):
+        self.asset.remarks = ''
+        self.asset.save()
+        self.assertEqual(self.search('dell'), [(self.asset2.pk, 20)])
+        device_info = self.asset.device_info
+        device_info.rack = 'R-12'
+        device_info.save()
+        self.assertEqual(self.search('r-1'), [(self.asset.pk, 3)])
+
+    def test_rebuild(self):
+        AssetSearchDocument.objects.all().delete()
+        AssetSearchToken.objects.all().delete()
+        self.assertEqual(
+            rebuild_search_documents(Asset.objects.all(), chunk_size=1), 2,
+        )
+        self.assertEqual(
+            self.search('dell'), [(self.asset2.pk, 20), (self.asset.pk, 1)],
+        )
+
+
+@override_settings(CACHES=SHARED_CACHES, ASSETS_CATEGORY_CACHE='shared')
+class TestCategorySearch(TestCase):
+    def setUp(self):
+        get_category_cache().clear()
+        self.subcategory = create_category()
+        self.category = self.subcategory.parent
+        self.deeper = AssetCategory(
+            name='Deeper', type=self.category.type, parent=self.subcategory,
+        )
+        self.deeper.save()
+        create_asset(sn='sn-1', category=self.subcategory)
+        create_asset(sn='sn-2', category=self.deeper)
+        create_asset(sn='sn-3')
+
+    def search(self, category):
+        plan = asset_search.compile({'category': unicode(category)})
+        return set(
+            Asset.objects.filter(plan.query).values_list('sn', flat=True)
+        )
+
+    def test_subtree(self):
+        self.assertEqual(self.search(self.category.id), {'sn-1', 'sn-2'})
+        self.assertEqual(self.search(self.subcategory.id), {'sn-1', 'sn-2'})
+        self.assertEqual(self.search(self.deeper.id), {'sn-2'})
+        self.assertEqual(self.search(self.deeper.id + 100), set())
+
+    def test_cached_tree(self):
+        get_category_tree()
+        with self.assertNumQueries(0):
+            asset_search.compile({'category': unicode(self.category.id)})
+
+    def test_invalidated_on_save(self):
+        get_category_tree()
+        other = AssetCategory(name='Other', type=self.category.type)
+        other.save()
+        self.assertEqual(get_category_tree().get(other.id).name, 'Other')
+        other.delete()
+        self.assertIsNone(get_category_tree().get(other.id))
+
+    def test_invalidated_by_other_process(self):
+        get_category_tree()
+        AssetCategory.objects.filter(pk=self.deeper.pk).update(name='Moved')
+        self.assertEqual(
+            get_category_tree().get(self.deeper.id).name, 'Deeper',
+        )
+        # another process saving a category bumps the generation through its
+        # own instance of the cache
+        bump_generation(get_cache('shared'), GENERATION_KEY)
+        self.assertEqual(
+            get_category_tree().get(self.deeper.id).name, 'Moved',
+        )
+
+    @override_settings(
+        ASSETS_CATEGORY_CACHE='django.core.cache.backends.locmem.LocMemCache',
+    )
+    def test_expires_with_local_cache(self):
+        get_category_tree()
+        with self.assertNumQueries(0):
+            get_category_tree()
+        with override_settings(ASSETS_CATEGORY_CACHE_TIMEOUT=0):
+            with self.assertNumQueries(1):
+                get_category_tree()
+
+    def test_form_choices(self):
+        get_category_tree()
+        with self.assertNumQueries(0):
+            form = SearchAssetForm(mode='dc')
+            choices = list(form.fields['category'].choices)
+        self.assertEqual(choices, [
+            ('', '---'),
+            (self.category.id, ' Category1'),
+            (self.subcategory.id, '|--- Subcategory'),
+            (self.deeper.id, '|---|--- Deeper'),
+        ])
+        self.assertEqual(
+            list(SearchAssetForm(mode='back_office').fields[
+                'category'
+            ].choices),
+            [('', '---')],
+        )
+
+    def test_blade_dependency(self):
+        blade = AssetCategory(
+            name='Blade', type=self.category.type, parent=self.category,
+            is_blade=True,
+        )
+        blade.save()
+        dependency, = AddDeviceForm(mode='dc').dependencies
+        self.assertEqual(set(dependency.value), {unicode(blade.id)})
+        self.assertTrue(dependency.met({'category': blade}))
+        self.assertFalse(dependency.met({'category': self.subcategory}))
+
+
+class TestUnlinked(TestCase):
+    def setUp(self):
+        self.stock = create_asset(sn='sn-1')
+        self.linked = create_asset(sn='sn-2')
+        self.linked.device_info.ralph_device_id = create_server().id
+        self.linked.device_info.save()
+        self.not_linked = create_asset(sn='sn-3')
+        self.not_linked.device_info.ralph_device_id = None
+        self.not_linked.device_info.save()
+
+    def test_find_unknown_device_ids(self):
+        self.assertEqual(
+            find_unknown_device_ids(chunk_size=1),
+            [self.stock.device_info.ralph_device_id],
+        )
+
+    def test_search(self):
+        plan = asset_search.compile({'unlinked': 'on'})
+        self.assertEqual(
+            set(Asset.objects.filter(plan.query).values_list(
+                'sn', flat=True,
+            )),
+            {'sn-1', 'sn-3'},
+        )
@@ -5,6 +5,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import os
+import tempfile
+
+from django.conf import settings
+
 from ralph_assets.models_assets import (
     Asset,
     AssetCategory,
@@ -28,6 +33,13 @@ DEFAULT_ASSET_DATA = dict(
     category='Category1',
 )
 
+# ``CACHES`` with a ``shared`` cache seen by all processes, unlike the local
+# memory one
+SHARED_CACHES = dict(settings.CACHES, shared=dict(
+    BACKEND='django.core.cache.backends.filebased.FileBasedCache',
+    LOCATION=os.path.join(tempfile.gettempdir(), 'ralph_assets_tests_cache'),
+))
+
 SCREEN_ERROR_MESSAGES = dict(
     duplicated_sn_or_bc='Please correct duplicated serial numbers or barcodes.',  # noqa
     duplicated_sn_in_field='There are duplicate serial numbers in field.',
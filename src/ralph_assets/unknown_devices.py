@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Assets linked to Ralph devices of unknown type.
+
+Ralph devices may be kept in another database than assets (see
+``ralph_assets.routers``). When they share one, assets are matched with a
+subquery. Otherwise the Ralph ids of such assets are collected by checking
+the linked ids in chunks against the Ralph database and cached for
+``ASSETS_UNKNOWN_DEVICES_TIMEOUT`` seconds, so neither database gets the
+list of all unknown devices as a query parameter.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import DEFAULT_DB_ALIAS, router
+from django.db.models import Q
+from ralph.discovery.models import Device, DeviceType
+
+from ralph_assets.models_assets import DeviceInfo
+from ralph_assets.models_util import CHUNK_SIZE
+
+
+CACHE_KEY = 'ralph_assets.unknown_devices'
+
+
+def get_unknown_devices_cache():
+    """The cache holding the ids: an alias from ``CACHES`` or a backend path
+    given in ``ASSETS_UNKNOWN_DEVICES_CACHE``."""
+    return get_cache(
+        getattr(settings, 'ASSETS_UNKNOWN_DEVICES_CACHE', 'default'),
+    )
+
+
+def get_unknown_devices_timeout():
+    return getattr(settings, 'ASSETS_UNKNOWN_DEVICES_TIMEOUT', 300)
+
+
+def share_database():
+    """Whether Ralph devices and assets are read from the same database."""
+    return (
+        (router.db_for_read(Device) or DEFAULT_DB_ALIAS) ==
+        (router.db_for_read(DeviceInfo) or DEFAULT_DB_ALIAS)
+    )
+
+
+def _get_unknown_devices():
+    return Device.objects.filter(model__type=DeviceType.unknown)
+
+
+def find_unknown_device_ids(chunk_size=CHUNK_SIZE):
+    """Return the sorted Ralph ids of devices of unknown type linked to
+    assets."""
+    linked = DeviceInfo.objects.filter(
+        ralph_device_id__isnull=False,
+    ).values_list('ralph_device_id', flat=True).distinct().order_by(
+        'ralph_device_id',
+    )
+    found = []
+    last_id = None
+    while True:
+        chunk_qs = linked
+        if last_id is not None:
+            chunk_qs = chunk_qs.filter(ralph_device_id__gt=last_id)
+        chunk = list(chunk_qs[:chunk_size])
+        if not chunk:
+            break
+        found.extend(_get_unknown_devices().filter(
+            id__in=chunk,
+        ).values_list('id', flat=True))
+        if len(chunk) < chunk_size:
+            break
+        last_id = chunk[-1]
+    return sorted(found)
+
+
+def get_unknown_device_ids():
+    """Return the cached Ralph ids of devices of unknown type linked to
+    assets."""
+    cache = get_unknown_devices_cache()
+    ids = cache.get(CACHE_KEY)
+    if ids is None:
+        ids = find_unknown_device_ids()
+        cache.set(CACHE_KEY, ids, get_unknown_devices_timeout())
+    return ids
+
+
+def get_unknown_device_query():
+    """Return a ``Q`` object matching assets linked to devices of unknown
+    type."""
+    if share_database():
+        ids = _get_unknown_devices().values('id')
+    else:
+        ids = get_unknown_device_ids()
+    return Q(device_info__ralph_device_id__in=ids)
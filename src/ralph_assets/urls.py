@@ -15,6 +15,7 @@ from ralph_assets.views import (
     BackOfficeBulkEdit,
     BackOfficeEditDevice,
     BackOfficeEditPart,
+    BackOfficeQuickSearch,
     BackOfficeSearch,
     DataCenterAddDevice,
     DataCenterAddPart,
@@ -22,6 +23,7 @@ from ralph_assets.views import (
     DataCenterSplitDevice,
     DataCenterEditDevice,
     DataCenterEditPart,
+    DataCenterQuickSearch,
     DataCenterSearch,
     DeleteAsset,
     HistoryAsset,
@@ -42,6 +44,9 @@ urlpatterns = patterns(
     url(r'dc/search',
         login_required(DataCenterSearch.as_view()),
         name='dc'),
+    url(r'dc/quick_search',
+        login_required(DataCenterQuickSearch.as_view()),
+        name='dc'),
     url(r'dc/add/device/',
         login_required(DataCenterAddDevice.as_view()),
         name='dc'),
@@ -73,6 +78,9 @@ urlpatterns = patterns(
     url(r'back_office/search',
         login_required(BackOfficeSearch.as_view()),
         name='back_office'),
+    url(r'back_office/quick_search',
+        login_required(BackOfficeQuickSearch.as_view()),
+        name='back_office'),
     url(r'back_office/add/device/',
         login_required(BackOfficeAddDevice.as_view()),
         name='back_office'),
@@ -5,24 +5,29 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import re
-from rq import get_current_job
-
 from collections import Counter
 
 from bob.data_table import DataTableColumn, DataTableMixin
 from bob.menu import MenuItem, MenuHeader
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.core.paginator import EmptyPage, InvalidPage, Paginator
 from django.core.urlresolvers import resolve, reverse
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Q
 from django.http import HttpResponseRedirect, Http404
 from django.forms.models import modelformset_factory, formset_factory
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
 
+from ralph_assets.counts import get_cached_count
+from ralph_assets.export import (
+    ExportPlan,
+    get_export_partitions,
+    make_csv_file_response,
+    make_csv_response,
+    write_csv_file,
+    write_partitioned_csv_file,
+)
 from ralph_assets.forms import (
     AddDeviceForm,
     AddPartForm,
@@ -34,30 +39,47 @@ from ralph_assets.forms import (
     EditPartForm,
     MoveAssetPartForm,
     OfficeForm,
+    QuickSearchForm,
     SearchAssetForm,
 )
+from ralph_assets.history import buffered_history
+from ralph_assets.history_archive import HistoryTimeline
 from ralph_assets.models import (
     Asset,
     AssetModel,
-    AssetCategory,
     DeviceInfo,
     OfficeInfo,
     PartInfo,
 )
-from ralph_assets.models_assets import AssetType
+from ralph_assets.models_assets import (
+    AssetType,
+    prefetch_discovered,
+    prefetch_ventures,
+)
 from ralph_assets.models_history import AssetHistoryChange
-from ralph.business.models import Venture
+from ralph_assets.models_search import quick_search
+from ralph_assets.pagination import (
+    AFTER,
+    BEFORE,
+    CachedCountPaginator,
+    KeysetPage,
+    KeysetPaginator,
+    get_count_limit,
+    get_keyset_key,
+    get_keyset_pagination,
+)
+from ralph_assets.progress import ProgressReporter
+from ralph_assets.search import asset_search, get_category_query
 from ralph.ui.views.common import Base
 from ralph.util.api_assets import get_device_components
-from ralph.util.reports import Report, set_progress
+from ralph.util.reports import Report
 
 
 SAVE_PRIORITY = 200
 HISTORY_PAGE_SIZE = 25
+QUICK_SEARCH_PAGE_SIZE = 25
 MAX_PAGE_SIZE = 65535
 
-QUOTATION_MARKS = re.compile(r"^\".+\"$")
-
 
 class AssetsMixin(Base):
     template_name = "assets/base.html"
@@ -109,6 +131,8 @@ class DataCenterMixin(AssetsMixin):
             ('/assets/dc/add/device', 'Add device', 'fugue-block--plus'),
             ('/assets/dc/add/part', 'Add part', 'fugue-block--plus'),
             ('/assets/dc/search', 'Search', 'fugue-magnifier'),
+            ('/assets/dc/quick_search', 'Quick search',
+                'fugue-magnifier-left'),
             ('/admin/ralph_assets', 'Admin', 'fugue-toolbox')
         )
         sidebar_menu = (
@@ -132,6 +156,8 @@ class BackOfficeMixin(AssetsMixin):
             ('/assets/back_office/add/part/', 'Add part',
                 'fugue-block--plus'),
             ('/assets/back_office/search', 'Search', 'fugue-magnifier'),
+            ('/assets/back_office/quick_search', 'Quick search',
+                'fugue-magnifier-left'),
         )
         sidebar_menu = (
             [MenuHeader('Back office actions')] +
@@ -218,179 +244,82 @@ class AssetSearch(AssetsMixin, DataTableMixin):
     ]
 
     def handle_search_data(self, get_csv=False):
-        search_fields = [
-            'niw',
-            'category',
-            'invoice_no',
-            'model',
-            'order_no',
-            'part_info',
-            'provider',
-            'sn',
-            'status',
-            'deleted',
-            'manufacturer',
-            'barcode',
-            'device_info',
-            'source',
-            'deprecation_rate',
-            'unlinked',
-            'ralph_device_id',
-        ]
-        # handle simple 'equals' search fields at once.
-        all_q = Q()
-        for field in search_fields:
-            field_value = self.request.GET.get(field)
-            if field_value:
-                exact = False
-                # if search term is enclosed in "", we want exact matches
-                if isinstance(field_value, basestring) and \
-                        QUOTATION_MARKS.search(field_value):
-                    exact = True
-                    field_value = field_value[1:-1]
-                if field == 'part_info':
-                    if field_value == 'device':
-                        all_q &= Q(part_info__isnull=True)
-                    elif field_value == 'part':
-                        all_q &= Q(part_info__gte=0)
-                elif field == 'model':
-                    if exact:
-                        all_q &= Q(model__name=field_value)
-                    else:
-                        all_q &= Q(model__name__icontains=field_value)
-                elif field == 'category':
-                    part = self.get_search_category_part(field_value)
-                    if part:
-                        all_q &= part
-                elif field == 'deleted':
-                    if field_value.lower() == 'on':
-                        all_q &= Q(deleted__in=(True, False))
-                elif field == 'manufacturer':
-                    if exact:
-                        all_q &= Q(model__manufacturer__name=field_value)
-                    else:
-                        all_q &= Q(
-                            model__manufacturer__name__icontains=field_value
-                        )
-                elif field == 'barcode':
-                    if exact:
-                        all_q &= Q(barcode=field_value)
-                    else:
-                        all_q &= Q(barcode__contains=field_value)
-                elif field == 'sn':
-                    if exact:
-                        all_q &= Q(sn=field_value)
-                    else:
-                        all_q &= Q(sn__icontains=field_value)
-                elif field == 'niw':
-                    if exact:
-                        all_q &= Q(niw=field_value)
-                    else:
-                        all_q &= Q(niw__icontains=field_value)
-                elif field == 'provider':
-                    if exact:
-                        all_q &= Q(provider=field_value)
-                    else:
-                        all_q &= Q(provider__icontains=field_value)
-                elif field == 'order_no':
-                    if exact:
-                        all_q &= Q(order_no=field_value)
-                    else:
-                        all_q &= Q(order_no__icontains=field_value)
-                elif field == 'invoice_no':
-                    if exact:
-                        all_q &= Q(invoice_no=field_value)
-                    else:
-                        all_q &= Q(invoice_no__icontains=field_value)
-                elif field == 'deprecation_rate':
-                    deprecation_rate_query_map = {
-                        'null': Q(deprecation_rate__isnull=True),
-                        'deprecated': Q(deprecation_rate=0),
-                        '6': Q(deprecation_rate__gt=0,
-                               deprecation_rate__lte=6),
-                        '12': Q(deprecation_rate__gt=6,
-                                deprecation_rate__lte=12),
-                        '24': Q(deprecation_rate__gt=12,
-                                deprecation_rate__lte=24),
-                        '48': Q(deprecation_rate__gt=24,
-                                deprecation_rate__lte=48),
-                        '48<': Q(deprecation_rate__gt=48),
-                    }
-                    all_q &= deprecation_rate_query_map[field_value]
-                elif field == 'unlinked' and field_value.lower() == 'on':
-                        all_q &= ~Q(device_info=None)
-                        all_q &= Q(device_info__ralph_device_id=None)
-                elif field == 'ralph_device_id':
-                    if exact:
-                        all_q &= Q(device_info__ralph_device_id=field_value)
-                    else:
-                        all_q &= Q(
-                            device_info__ralph_device_id__icontains=field_value
-                        )
-                else:
-                    q = Q(**{field: field_value})
-                    all_q = all_q & q
-        # now fields within ranges.
-        search_date_fields = [
-            'invoice_date', 'request_date', 'delivery_date',
-            'production_use_date', 'provider_order_date',
-        ]
-        for date in search_date_fields:
-            start = self.request.GET.get(date + '_from')
-            end = self.request.GET.get(date + '_to')
-            if start:
-                all_q &= Q(**{date + '__gte': start})
-            if end:
-                all_q &= Q(**{date + '__lte': end})
+        self.search_plan = asset_search.compile(self.request.GET)
+        all_q = self.search_plan.query
         if get_csv:
             return self.get_csv_data(self.get_all_items(all_q))
         else:
-            self.data_table_query(self.get_all_items(all_q))
+            self.data_table_query(
+                self.get_all_items(all_q).select_related('device_info'),
+            )
 
     def get_search_category_part(self, field_value):
+        return get_category_query(field_value)
+
+    def get_count_key(self):
+        """Identifies the search results in the count cache: by the mode,
+        whether deleted assets are included and the applied search
+        parameters."""
+        include_deleted = self.request.GET.get('deleted') or ''
+        return (
+            _get_mode(self.request),
+            include_deleted.lower() == 'on',
+        ) + tuple(
+            '{}={}'.format(name, value)
+            for name, value in self.search_plan.get_params()
+        )
+
+    def _paginate(self, queryset):
+        if get_keyset_pagination():
+            return self._paginate_keyset(queryset)
         try:
-            category_id = int(field_value)
+            self.page_number = int(
+                self.request.GET.get(self.query_variable_name) or 1
+            )
         except ValueError:
-            pass
-        else:
-            category = AssetCategory.objects.get(id=category_id)
-            children = [x.id for x in category.get_children()]
-            categories = [category_id, ] + children
-            return Q(category_id__in=categories)
+            self.page_number = 1
+        self.paginator = CachedCountPaginator(
+            queryset, self.rows_per_page, self.get_count_key(),
+        )
+        try:
+            return self.paginator.page(self.page_number)
+        except EmptyPage:
+            return self.paginator.page(1)
+
+    def _paginate_keyset(self, queryset):
+        sort = self.sort or ''
+        self.paginator = KeysetPaginator(
+            queryset,
+            self.rows_per_page,
+            key=get_keyset_key(Asset, sort.lstrip('-')),
+            descending=sort.startswith('-'),
+            count_limit=get_count_limit(),
+            count_key=self.get_count_key(),
+        )
+        return self.paginator.page(
+            after=self.request.GET.get(AFTER),
+            before=self.request.GET.get(BEFORE),
+        )
 
     def get_csv_header(self):
         header = super(AssetSearch, self).get_csv_header()
         return ['type'] + header
 
     def get_csv_rows(self, queryset, type, model):
-        data = [self.get_csv_header()]
-        total = queryset.count()
-        processed = 0
-        job = get_current_job()
-        for asset in queryset:
-            row = ['part', ] if asset.part_info else ['device', ]
-            for item in self.columns:
-                field = item.field
-                if field:
-                    nested_field_name = item.foreign_field_name
-                    if nested_field_name == type:
-                        cell = self.get_cell(
-                            getattr(asset, type), field, model
-                        )
-                    elif nested_field_name == 'part_info':
-                        cell = self.get_cell(asset.part_info, field, PartInfo)
-                    elif nested_field_name == 'venture':
-                        cell = self.get_cell(asset.venture, field, Venture)
-                    elif nested_field_name == 'is_discovered':
-                        cell = unicode(asset.is_discovered)
-                    else:
-                        cell = self.get_cell(asset, field, Asset)
-                    row.append(unicode(cell))
-            data.append(row)
-            processed += 1
-            set_progress(job, processed / total)
-        set_progress(job, 1)
-        return data
+        """Yield the header and exported rows, fetching assets in chunks."""
+        yield self.get_csv_header()
+        plan = ExportPlan(self.columns, type, model, self.get_cell)
+        progress = ProgressReporter(
+            get_cached_count(self.get_count_key(), queryset.count),
+        )
+        for rows in plan.get_chunks(queryset):
+            for row in rows:
+                yield row
+            progress.advance(len(rows))
+        progress.finish()
+
+    def make_csv_response(self, data):
+        return make_csv_response(data, self.csv_file_name)
 
     def get_all_items(self, q_object):
         return Asset.objects.filter(q_object).order_by('id')
@@ -403,6 +332,19 @@ class AssetSearch(AssetsMixin, DataTableMixin):
                 **kwargs
             )
         )
+        page = ret.get('bob_page')
+        if page is not None:
+            page.object_list = prefetch_discovered(
+                prefetch_ventures(page.object_list),
+            )
+        if isinstance(page, KeysetPage):
+            ret.update({
+                'keyset_pagination': True,
+                'url_next_page': page.get_next_query(self.request.GET),
+                'url_previous_page': page.get_previous_query(
+                    self.request.GET,
+                ),
+            })
         ret.update({
             'form': self.form,
             'header': self.header,
@@ -510,7 +452,7 @@ class DataCenterSearch(Report, DataCenterMixin, AssetSearch):
 
     def get_response(self, request, result):
         if self.export == 'csv':
-            return self.make_csv_response(result)
+            return make_csv_file_response(result, self.csv_file_name)
 
     def __init__(self, *args, **kwargs):
         self.columns = (
@@ -523,10 +465,20 @@ class DataCenterSearch(Report, DataCenterMixin, AssetSearch):
         return self.export == 'csv'
 
     def get_csv_data(self, queryset):
-        data = super(DataCenterSearch, self).get_csv_rows(
+        """Write the export to a file and return its path."""
+        partitions = get_export_partitions()
+        if partitions > 1:
+            return write_partitioned_csv_file(
+                queryset,
+                self.get_csv_header(),
+                self.columns,
+                'device_info',
+                DeviceInfo,
+                partitions,
+            )
+        return write_csv_file(super(DataCenterSearch, self).get_csv_rows(
             queryset, type='device_info', model=DeviceInfo
-        )
-        return data
+        ))
 
     def get_all_items(self, query):
         include_deleted = self.request.GET.get('deleted')
@@ -535,6 +487,61 @@ class DataCenterSearch(Report, DataCenterMixin, AssetSearch):
         return Asset.objects_dc.filter(query)
 
 
+class QuickSearch(AssetsMixin):
+    """Assets matching all words of a single query in any of their text
+    fields, ranked by the search documents."""
+
+    sidebar_selected = 'quick search'
+    template_name = 'assets/quick_search.html'
+
+    def get_context_data(self, **kwargs):
+        ret = super(QuickSearch, self).get_context_data(**kwargs)
+        form = QuickSearchForm(self.request.GET)
+        query = form.cleaned_data['q'] if form.is_valid() else ''
+        ranking = quick_search(query, self.get_all_items())
+        try:
+            page = int(self.request.GET.get('page', 1))
+        except ValueError:
+            page = 1
+        try:
+            results_page = Paginator(ranking, QUICK_SEARCH_PAGE_SIZE).page(
+                page,
+            )
+        except InvalidPage:
+            raise Http404
+        scores = [
+            (row['asset'], row['score']) for row in results_page.object_list
+        ]
+        assets = Asset.admin_objects.select_related(
+            'model', 'device_info', 'part_info',
+        ).in_bulk([asset_id for asset_id, score in scores])
+        results_page.object_list = [
+            (assets[asset_id], score) for asset_id, score in scores
+            if asset_id in assets
+        ]
+        ret.update({
+            'form': form,
+            'header': self.header,
+            'query': query,
+            'results_page': results_page,
+        })
+        return ret
+
+
+class BackOfficeQuickSearch(BackOfficeMixin, QuickSearch):
+    header = 'Quick search BO Assets'
+
+    def get_all_items(self):
+        return Asset.objects_bo.all()
+
+
+class DataCenterQuickSearch(DataCenterMixin, QuickSearch):
+    header = 'Quick search DC Assets'
+
+    def get_all_items(self):
+        return Asset.objects_dc.all()
+
+
 def _get_mode(request):
     current_url = resolve(request.get_full_path())
     url_name = current_url.url_name
@@ -795,7 +802,7 @@ class EditDevice(Base):
     def get_context_data(self, **kwargs):
         ret = super(EditDevice, self).get_context_data(**kwargs)
         status_history = AssetHistoryChange.objects.all().filter(
-            asset=kwargs.get('asset_id'), field_name__exact='status'
+            owner_asset=kwargs.get('asset_id'), field_name__exact='status'
         ).order_by('-date')
         ret.update({
             'asset_form': self.asset_form,
@@ -932,7 +939,7 @@ class EditPart(Base):
     def get_context_data(self, **kwargs):
         ret = super(EditPart, self).get_context_data(**kwargs)
         status_history = AssetHistoryChange.objects.all().filter(
-            asset=kwargs.get('asset_id'), field_name__exact='status'
+            owner_asset=kwargs.get('asset_id'), field_name__exact='status'
         ).order_by('-date')
         ret.update({
             'asset_form': self.asset_form,
@@ -1042,15 +1049,10 @@ class HistoryAsset(BackOfficeMixin):
         ret = super(HistoryAsset, self).get_context_data(**kwargs)
         asset_id = kwargs.get('asset_id')
         asset = Asset.admin_objects.get(id=asset_id)
-        history = AssetHistoryChange.objects.filter(
-            Q(asset_id=asset.id) |
-            Q(device_info_id=getattr(asset.device_info, 'id', 0)) |
-            Q(part_info_id=getattr(asset.part_info, 'id', 0)) |
-            Q(office_info_id=getattr(asset.office_info, 'id', 0))
-        ).order_by('-date')
         status = bool(self.request.GET.get('status', ''))
-        if status:
-            history = history.filter(field_name__exact='status')
+        history = HistoryTimeline(
+            asset.id, field_name='status' if status else None,
+        )
         try:
             page = int(self.request.GET.get(query_variable_name, 1))
         except ValueError:
@@ -1107,7 +1109,7 @@ class BulkEdit(Base):
         )
         self.asset_formset = AssetFormSet(self.request.POST)
         if self.asset_formset.is_valid():
-            with transaction.commit_on_success():
+            with transaction.commit_on_success(), buffered_history():
                 instances = self.asset_formset.save(commit=False)
                 for instance in instances:
                     instance.modified_by = self.request.user.get_profile()
@@ -1236,7 +1238,7 @@ class DataCenterSplitDevice(DataCenterMixin):
         )
         self.asset_formset = AssetFormSet(self.request.POST)
         if self.asset_formset.is_valid():
-            with transaction.commit_on_success():
+            with transaction.commit_on_success(), buffered_history():
                 for instance in self.asset_formset.forms:
                     form = instance.save(commit=False)
                     model_name = instance['model_user'].value()